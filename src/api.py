@@ -1,8 +1,13 @@
 import asyncio
 import logging
 import math
+import re
+from contextlib import asynccontextmanager
+from functools import lru_cache, partial
+from operator import attrgetter
 from datetime import datetime
 from typing import List
+from cachetools import TTLCache
 from fastapi import FastAPI, HTTPException, Security, Depends
 from fastapi.security.api_key import APIKeyHeader
 from ib_async import IB, Option, Contract, ExecutionFilter
@@ -14,9 +19,108 @@ from src.models import AccountSummary, PositionItem, CurrencyItem, OptionGreeks,
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("ibkr-api")
 
-app = FastAPI(title="IBKR API", version="1.0.0")
 ib = IB()
 
+# Backpressure: caps concurrent requests to the Gateway so bursts queue here
+# instead of tripping IBKR pacing limits
+ib_semaphore = asyncio.Semaphore(settings.IB_MAX_CONCURRENCY)
+
+# Seconds to wait between reconnect rounds once all retries have failed
+RECONNECT_PAUSE = 10
+
+# Seconds a fetched /option/risk result is reused for repeated polling
+OPTION_RISK_CACHE_TTL = 3
+
+# Seconds qualified contracts and option chain parameters are reused
+CONTRACT_CACHE_TTL = 3600
+
+# Seconds /contract/search results are reused
+CONTRACT_SEARCH_CACHE_TTL = 300
+
+# In-flight IBKR lookups and recently completed results, keyed by request
+_option_risk_inflight: dict[tuple, asyncio.Future] = {}
+_option_risk_cache = TTLCache(maxsize=256, ttl=OPTION_RISK_CACHE_TTL)
+_qualify_inflight: dict[tuple, asyncio.Future] = {}
+_qualify_cache = TTLCache(maxsize=1024, ttl=CONTRACT_CACHE_TTL)
+_chain_inflight: dict[tuple, asyncio.Future] = {}
+_chain_cache = TTLCache(maxsize=1024, ttl=CONTRACT_CACHE_TTL)
+_details_inflight: dict[tuple, asyncio.Future] = {}
+_details_cache = TTLCache(maxsize=1024, ttl=CONTRACT_SEARCH_CACHE_TTL)
+
+
+async def connect_ib() -> bool:
+    """Connect to the IBKR Gateway, retrying with exponential backoff."""
+    retries = 3
+    delay = 2
+    for i in range(retries):
+        try:
+            logger.info(f"Connecting to IBKR Gateway (Attempt {i+1}/{retries})...")
+            await ib.connectAsync(
+                settings.IB_HOST, 
+                settings.IB_PORT, 
+                clientId=settings.IB_CLIENT_ID
+            )
+            logger.info("Connected to IBKR Gateway")
+            # Market data type is per connection, so set it once here rather than per request
+            ib.reqMarketDataType(4) # Delayed-Frozen fallback
+            return True
+        except Exception as e:
+            logger.warning(f"Connection attempt {i+1} failed: {e}")
+            if i < retries - 1:
+                await asyncio.sleep(delay)
+                delay *= 2
+            else:
+                logger.error("All connection attempts failed.")
+    return False
+
+
+async def ib_watchdog():
+    """Keep the Gateway connection alive, reconnecting whenever it drops."""
+    disconnected = asyncio.Event()
+
+    def on_disconnect():
+        disconnected.set()
+
+    ib.disconnectedEvent += on_disconnect
+    try:
+        while True:
+            if ib.isConnected():
+                await disconnected.wait()
+                disconnected.clear()
+                # A failed attempt inside connect_ib can set the event after a
+                # later attempt succeeded; only reconnect a session that is down
+                if ib.isConnected():
+                    continue
+                logger.warning("Lost connection to IBKR Gateway, reconnecting...")
+            if await connect_ib():
+                # Drop disconnects fired by the attempts that failed on the way
+                disconnected.clear()
+            else:
+                await asyncio.sleep(RECONNECT_PAUSE)
+    finally:
+        ib.disconnectedEvent -= on_disconnect
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Connect once at startup; the watchdog owns reconnects from then on,
+    # so a Gateway that is still booting does not prevent the API from starting.
+    await connect_ib()
+    watchdog = asyncio.create_task(ib_watchdog())
+    option_risk_batcher.start()
+    yield
+    await option_risk_batcher.stop()
+    watchdog.cancel()
+    try:
+        await watchdog
+    except asyncio.CancelledError:
+        pass
+    ib.disconnect()
+
+
+app = FastAPI(title="IBKR API", version="1.0.0", lifespan=lifespan)
+
+
 @app.get("/health")
 async def health_check():
     """Liveness probe endpoint."""
@@ -41,6 +145,13 @@ MARKET_SUFFIXES = {
     ".MI": ("BVME", "EUR"),    # Italy (Milan)
 }
 
+# Venues tried when qualifying a SMART-routed option underlying, in preference order
+UNDERLYING_VENUES = ("SMART", "NYSE", "NASDAQ")
+
+# Matches any known market suffix at the end of an (uppercased) symbol
+_SUFFIX_RE = re.compile('(' + '|'.join(re.escape(s) for s in MARKET_SUFFIXES) + ')$')
+
+@lru_cache(maxsize=8192)
 def parse_symbol(symbol: str) -> tuple:
     """
     Parse a symbol with optional market suffix.
@@ -53,66 +164,130 @@ def parse_symbol(symbol: str) -> tuple:
     """
     symbol = symbol.upper().strip()
     
-    for suffix, (exchange, currency) in MARKET_SUFFIXES.items():
-        if symbol.endswith(suffix.upper()):
-            ticker = symbol[:-len(suffix)]
-            return (ticker, exchange, currency)
+    m = _SUFFIX_RE.search(symbol)
+    if m:
+        exchange, currency = MARKET_SUFFIXES[m.group(1)]
+        return (symbol[:m.start()], exchange, currency)
     
     # Default: US stock
     return (symbol, "SMART", "USD")
 
 
-async def get_ib():
+def require_ib() -> IB:
     if not ib.isConnected():
-        retries = 3
-        delay = 2
-        for i in range(retries):
-            try:
-                logger.info(f"Connecting to IBKR Gateway (Attempt {i+1}/{retries})...")
-                await ib.connectAsync(
-                    settings.IB_HOST, 
-                    settings.IB_PORT, 
-                    clientId=settings.IB_CLIENT_ID
-                )
-                logger.info("Connected to IBKR Gateway")
-                return ib
-            except Exception as e:
-                logger.warning(f"Connection attempt {i+1} failed: {e}")
-                if i < retries - 1:
-                    await asyncio.sleep(delay)
-                    delay *= 2
-                else:
-                    logger.error("All connection attempts failed.")
-                    raise HTTPException(status_code=503, detail="Could not connect to IBKR")
+        raise HTTPException(status_code=503, detail="Could not connect to IBKR")
     return ib
 
+
+async def ib_call(func, *args, **kwargs):
+    """Await an IBKR request while holding a slot of the IB_MAX_CONCURRENCY limit."""
+    async with ib_semaphore:
+        return await func(*args, **kwargs)
+
+
+def _num(x, default=0.0):
+    """Return x if it is a finite number, otherwise default (IBKR uses NaN for missing values)."""
+    return x if x is not None and math.isfinite(x) else default
+
+
+async def cached_call(cache: TTLCache, inflight: dict, key: tuple, factory):
+    """
+    Return a cached result for key, or await factory() to produce it.
+    Concurrent callers for the same key share one in-flight call; empty
+    results are not cached so a transient miss is retried next time.
+    """
+    if key in cache:
+        return cache[key]
+    fut = inflight.get(key)
+    if fut is None:
+        fut = asyncio.ensure_future(factory())
+        inflight[key] = fut
+
+        def done(f: asyncio.Future):
+            inflight.pop(key, None)
+            if not f.cancelled() and f.exception() is None and f.result():
+                cache[key] = f.result()
+
+        fut.add_done_callback(done)
+    # Shield so a client disconnecting does not cancel the call for everyone else
+    return await asyncio.shield(fut)
+
+
+async def qualify_cached(client: IB, *contracts: Contract) -> list:
+    """
+    qualifyContractsAsync backed by a TTL cache.
+    Returns the qualified contracts in order, with None for unknown ones
+    (or ones whose qualification failed, which are logged).
+    """
+    async def qualify(contract):
+        await ib_call(client.qualifyContractsAsync, contract)
+        return contract if contract.conId else None
+
+    results = await asyncio.gather(*(
+        cached_call(
+            _qualify_cache, _qualify_inflight,
+            (c.symbol, c.secType, c.exchange, c.currency, c.strike, c.right, c.lastTradeDateOrContractMonth),
+            partial(qualify, c)
+        )
+        for c in contracts
+    ), return_exceptions=True)
+    for c, r in zip(contracts, results):
+        if isinstance(r, BaseException):
+            logger.warning(f"Qualification failed for {c.symbol} {c.lastTradeDateOrContractMonth} {c.strike} {c.right}: {r}")
+    return [None if isinstance(r, BaseException) else r for r in results]
+
+
+async def sec_def_opt_params_cached(client: IB, underlying: Contract) -> list:
+    """reqSecDefOptParamsAsync backed by a TTL cache."""
+    return await cached_call(
+        _chain_cache, _chain_inflight,
+        (underlying.symbol, underlying.secType, underlying.conId),
+        partial(
+            ib_call,
+            client.reqSecDefOptParamsAsync,
+            underlying.symbol,
+            "",  # futFopExchange (empty for stocks)
+            underlying.secType,
+            underlying.conId
+        )
+    )
+
+
+_account_value_fields = attrgetter('tag', 'currency', 'value')
+
 @app.get("/account/summary", response_model=AccountSummary, dependencies=[Depends(verify_key)])
-async def get_summary():
-    client = await get_ib()
+async def get_summary(client: IB = Depends(require_ib)):
     v = client.accountValues()
+
+    # Index account values in one pass: first value per (tag, currency) and per tag
+    by_tc = {}
+    by_tag = {}
+    net_liq_currencies = []
+    cash = {}
+    for tag, currency, value in map(_account_value_fields, v):
+        by_tc.setdefault((tag, currency), value)
+        by_tag.setdefault(tag, value)
+        if tag == 'NetLiquidation':
+            net_liq_currencies.append(currency)
+        elif tag == 'CashBalance':
+            cash.setdefault(currency, float(value))
     
     def get_val(tag, currency=None, default="0"):
         # Most tags we want are either 'BASE' or the account's primary currency
         # We search for the tag with a currency first, then fallback to any.
-        matches = [x for x in v if x.tag == tag]
-        if not matches: return default
+        if tag not in by_tag: return default
         
         # If we specify a preference, try that first
-        if currency:
-            for m in matches:
-                if m.currency == currency: return m.value
+        if currency and (tag, currency) in by_tc:
+            return by_tc[(tag, currency)]
         
-        # Otherwise, prioritize 'BASE' then non-empty currency
-        for m in matches:
-            if m.currency == 'BASE': return m.value
-        
-        return matches[0].value
+        # Otherwise, prioritize 'BASE' then the first currency reported
+        return by_tc.get((tag, 'BASE'), by_tag[tag])
 
-    net_liq_obj = next((x for x in v if x.tag == 'NetLiquidation' and x.currency != 'BASE'), None)
-    if not net_liq_obj:
-        net_liq_obj = next((x for x in v if x.tag == 'NetLiquidation'), None)
-    
-    base_curr = net_liq_obj.currency if net_liq_obj else "Unknown"
+    base_curr = next(
+        (c for c in net_liq_currencies if c != 'BASE'),
+        net_liq_currencies[0] if net_liq_currencies else "Unknown"
+    )
 
     # Fetch Daily P&L using the pnl() function
     # This requires subscribing to P&L updates first
@@ -150,10 +325,8 @@ async def get_summary():
                 pnl_data = pnl_result
             
             if pnl_data:
-                if hasattr(pnl_data, 'dailyPnL') and pnl_data.dailyPnL is not None and not math.isnan(pnl_data.dailyPnL):
-                    daily_pnl = pnl_data.dailyPnL
-                if hasattr(pnl_data, 'realizedPnL') and pnl_data.realizedPnL is not None and not math.isnan(pnl_data.realizedPnL):
-                    daily_realized = pnl_data.realizedPnL
+                daily_pnl = _num(getattr(pnl_data, 'dailyPnL', None))
+                daily_realized = _num(getattr(pnl_data, 'realizedPnL', None))
         except Exception as e:
             logger.error(f"Error fetching PnL: {e}")
     else:
@@ -175,174 +348,316 @@ async def get_summary():
         DailyPnL=daily_pnl,
         DailyRealizedPnL=daily_realized,
         StockMarketValue=float(get_val('StockMarketValue', 'BASE')),
-        EUR=float(get_val('CashBalance', 'EUR')),
-        USD=float(get_val('CashBalance', 'USD')),
-        GBP=float(get_val('CashBalance', 'GBP')),
-        CHF=float(get_val('CashBalance', 'CHF')),
-        SEK=float(get_val('CashBalance', 'SEK'))
+        EUR=cash.get('EUR', 0.0),
+        USD=cash.get('USD', 0.0),
+        GBP=cash.get('GBP', 0.0),
+        CHF=cash.get('CHF', 0.0),
+        SEK=cash.get('SEK', 0.0)
     )
 
 
 @app.get("/account/positions", response_model=List[PositionItem], dependencies=[Depends(verify_key)])
-async def get_positions():
-    client = await get_ib()
+async def get_positions(client: IB = Depends(require_ib)):
+    # IBKR data is trusted, so response models are built without re-validation
     items = []
     for p in client.positions():
-        item = PositionItem(
-            symbol=p.contract.localSymbol, 
+        c = p.contract
+        if c.secType == 'OPT':
+            option_fields = dict(
+                expiry=c.lastTradeDateOrContractMonth,
+                strike=c.strike,
+                right=c.right,
+                underlying=c.symbol
+            )
+        else:
+            option_fields = {}
+        items.append(PositionItem.model_construct(
+            symbol=c.localSymbol, 
             qty=p.position, 
             cost=p.avgCost,
-            secType=p.contract.secType
-        )
-        if p.contract.secType == 'OPT':
-            item.expiry = p.contract.lastTradeDateOrContractMonth
-            item.strike = p.contract.strike
-            item.right = p.contract.right
-            item.underlying = p.contract.symbol
-        items.append(item)
+            secType=c.secType,
+            **option_fields
+        ))
     return items
 
 @app.get("/account/currencies", response_model=List[CurrencyItem], dependencies=[Depends(verify_key)])
-async def get_currencies():
-    client = await get_ib()
+async def get_currencies(client: IB = Depends(require_ib)):
     return [
-        CurrencyItem(currency=v.currency, amount=float(v.value)) 
+        CurrencyItem.model_construct(currency=v.currency, amount=float(v.value)) 
         for v in client.accountValues() 
         if v.tag == 'CashBalance' and v.currency != 'BASE'
     ]
 
 
 
-@app.get("/option/risk/{symbol}", response_model=OptionGreeks, dependencies=[Depends(verify_key)])
-async def get_option_risk(symbol: str):
+# OSI option symbol, matched with spaces removed: TICKER + YYMMDD + C/P + 8-digit strike
+_OSI_RE = re.compile(r'^(.*?)(\d{6})([CP])(\d{8})$', re.IGNORECASE)
+# European option localSymbol: RIGHT TICKER YYYYMMDD STRIKE [MULTIPLIER]
+_EU_RE = re.compile(r'^([CP])\s+(\S+)\s+(\d{8})\s+(\d+(?:\.\d+)?)(?:\s+.*)?$', re.IGNORECASE)
+
+def parse_option_symbol(symbol: str) -> tuple:
     """
-    Fetch Greeks for an option symbol.
-    
+    Parse an option symbol.
+    Returns (ticker, expiry, strike, right, currency, is_european_format).
+
     Supports two formats:
     1. OSI Format (US options): TICKER YYMMDD C/P STRIKE (continuous string)
        Example: ASTS251114P00050000
     2. IBKR localSymbol format (European options): R TICKER YYYYMMDD STRIKE M
        Example: P HMI  20260220 1900 M
     """
-    client = await get_ib()
-    client.reqMarketDataType(4) # Delayed-Frozen fallback
+    # Detect format:
+    # European format: starts with "P " or "C " (right first), e.g., "P HMI  20260220 1900 M"
+    # OSI Format: ends with YYMMDD + P/C + 8-digit strike, e.g., "ASTS  260109P00065000"
+    #             May have padding spaces between ticker and date
     
-    try:
-        symbol = symbol.strip()
+    # Check if it's European format (starts with P or C, either case, followed by space)
+    is_european_format = symbol[:2].upper() in ('P ', 'C ')
+    
+    if is_european_format:
+        # European/IBKR localSymbol format: "P HMI  20260220 1900 M"
+        # Format: RIGHT SYMBOL YYYYMMDD STRIKE MULTIPLIER
+        m = _EU_RE.match(symbol)
+        if not m:
+            raise HTTPException(status_code=400, detail=f"Invalid option symbol format: {symbol}")
         
-        # Detect format:
-        # European format: starts with "P " or "C " (right first), e.g., "P HMI  20260220 1900 M"
-        # OSI Format: ends with YYMMDD + P/C + 8-digit strike, e.g., "ASTS  260109P00065000"
-        #             May have padding spaces between ticker and date
+        # right: P or C, raw_ticker: HMI, RMS, etc., expiry: YYYYMMDD (already in correct format)
+        # The multiplier indicator (M) is ignored for contract creation
+        right, raw_ticker, expiry, strike_raw = m.groups()
+        strike_val = float(strike_raw)  # Strike price as-is (no division needed)
         
-        # Check if it's European format (starts with P or C followed by space)
-        is_european_format = len(symbol) > 2 and symbol[0] in ('P', 'C') and symbol[1] == ' '
+        # Parse ticker for international stocks (e.g., HMI.PA -> SBF/EUR)
+        # Note: European option tickers usually don't have suffix in localSymbol,
+        # but the underlying might have been originally specified with one
+        ticker, exchange, currency = parse_symbol(raw_ticker)
         
-        if is_european_format:
-            # European/IBKR localSymbol format: "P HMI  20260220 1900 M"
-            # Format: RIGHT SYMBOL YYYYMMDD STRIKE MULTIPLIER
-            parts = symbol.split()
-            
-            if len(parts) < 4:
-                raise HTTPException(status_code=400, detail=f"Invalid option symbol format: {symbol}")
-            
-            # Parse based on position
-            right = parts[0]  # P or C
-            raw_ticker = parts[1]  # HMI, RMS, etc.
-            expiry = parts[2]  # YYYYMMDD (already in correct format)
-            strike_val = float(parts[3])  # Strike price as-is (no division needed)
-            # parts[4] is multiplier indicator (M), ignored for contract creation
-            
-            # Parse ticker for international stocks (e.g., HMI.PA -> SBF/EUR)
-            # Note: European option tickers usually don't have suffix in localSymbol,
-            # but the underlying might have been originally specified with one
-            ticker, exchange, currency = parse_symbol(raw_ticker)
-            
-            # For European format options without suffix, default to EUR instead of USD
-            # since most European options trade in EUR
-            if currency == "USD" and '.' not in raw_ticker:
-                currency = "EUR"
-        else:
-            # OSI Format (US options): "ASTS  260109P00065000" or "ASTS260109P00065000"
-            # Remove any internal spaces (padding between ticker and date)
-            symbol_clean = symbol.replace(' ', '')
-            
-            # Strike: Last 8 chars (divided by 1000)
-            strike_val = float(symbol_clean[-8:]) / 1000.0
-            # Right: -9 char
-            right = symbol_clean[-9]
-            # Expiry: -15 to -9 (YYMMDD)
-            expiry_raw = symbol_clean[-15:-9]
-            expiry = f"20{expiry_raw[0:2]}{expiry_raw[2:4]}{expiry_raw[4:6]}"
-            # Ticker: everything before expiry (may contain market suffix like .L)
-            raw_ticker = symbol_clean[:-15].strip()
-            
-            # Parse ticker for international stocks (e.g., BATS.L -> LSE/GBP)
-            ticker, exchange, currency = parse_symbol(raw_ticker)
-
-        # Build contract - try to qualify it
-        contract = Option(ticker, expiry, strike_val, 'P' if right == 'P' else 'C', 'SMART', currency=currency)
-
-        # 2. Qualify Contract
-        qualified = await client.qualifyContractsAsync(contract)
-        
-        # For European format, if qualification fails with current currency, try alternatives
-        if (not qualified or not qualified[0]) and is_european_format:
-            # Try with different currencies: EUR, GBP, CHF
-            for alt_currency in ['EUR', 'GBP', 'CHF', 'USD']:
-                if alt_currency == currency:
-                    continue  # Already tried this one
-                contract = Option(ticker, expiry, strike_val, 'P' if right == 'P' else 'C', 'SMART', currency=alt_currency)
-                qualified = await client.qualifyContractsAsync(contract)
-                if qualified and qualified[0]:
-                    logger.info(f"Found European option with currency {alt_currency}: {symbol}")
-                    break
+        # For European format options without suffix, default to EUR instead of USD
+        # since most European options trade in EUR
+        if currency == "USD" and '.' not in raw_ticker:
+            currency = "EUR"
+    else:
+        # OSI Format (US options): "ASTS  260109P00065000" or "ASTS260109P00065000"
+        # Ticker (may contain market suffix like .L and padding), YYMMDD, right, strike * 1000
+        m = _OSI_RE.match(symbol.replace(' ', ''))
+        if not m:
+            raise HTTPException(status_code=400, detail=f"Invalid option symbol format: {symbol}")
         
-        if not qualified or not qualified[0]:
-            raise HTTPException(status_code=404, detail=f"Option contract not found for {symbol}")
+        raw_ticker, expiry_raw, right, strike_raw = m.groups()
+        expiry = "20" + expiry_raw
+        strike_val = int(strike_raw) / 1000
         
-        # 3. Request Data and wait for it to arrive
+        # Parse ticker for international stocks (e.g., BATS.L -> LSE/GBP)
+        ticker, exchange, currency = parse_symbol(raw_ticker)
+
+    right = right.upper()
+    return (ticker, expiry, strike_val, right, currency, is_european_format)
+
+
+def has_option_data(t) -> bool:
+    """True once a ticker carries Greeks or a last price."""
+    g = t.modelGreeks or t.bidGreeks or t.askGreeks or t.lastGreeks
+    return bool(g) or _num(t.last, None) is not None
+
+
+def build_option_greeks(symbol: str, t) -> OptionGreeks:
+    # Fallback logic: Model -> Bid -> Ask -> Last
+    g = t.modelGreeks or t.bidGreeks or t.askGreeks or t.lastGreeks
+    
+    t_vol = getattr(t, 'volume', None)
+    t_oi = getattr(t, 'openInterest', None)
+    t_last = getattr(t, 'last', None)
+    t_time = getattr(t, 'lastTime', None)
+    
+    return OptionGreeks(
+        symbol=symbol,
+        delta=_num(g.delta) if g else 0.0,
+        gamma=_num(g.gamma) if g else 0.0,
+        vega=_num(g.vega) if g else 0.0,
+        theta=_num(g.theta) if g else 0.0,
+        implied_vol=_num(g.impliedVol) if g else 0.0,
+        underlying_price=_num(g.undPrice) if g else 0.0,
+        volume=int(_num(t_vol, 0)),
+        open_interest=int(_num(t_oi, 0)),
+        last_price=_num(t_last),
+        last_date=t_time.strftime("%Y-%m-%d %H:%M:%S") if t_time else None
+    )
+
+
+class OptionRiskBatcher:
+    """
+    Collects option risk lookups arriving within a short window and resolves
+    them together: the per-contract qualification calls are gathered
+    concurrently and share one wait for market data, instead of a serial
+    round trip per symbol.
+    """
+
+    def __init__(self, client: IB, window: float = 0.02, timeout: float = 5.0):
+        self.client = client
+        self.window = window
+        self.timeout = timeout
+        self._pending: list[tuple[str, tuple, asyncio.Future]] = []
+        self._wakeup = asyncio.Event()
+        self._worker = None
+        self._batches = set()
+
+    def start(self):
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        tasks = list(self._batches)
+        if self._worker:
+            tasks.append(self._worker)
+            self._worker = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for _, _, fut in self._pending:
+            fut.cancel()
+        self._pending = []
+
+    def submit(self, symbol: str, parsed: tuple) -> asyncio.Future:
+        """Queue a parsed option symbol (see parse_option_symbol) for the next batch."""
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.append((symbol, parsed, fut))
+        self._wakeup.set()
+        return fut
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            # Give concurrent requests a moment to join the batch
+            await asyncio.sleep(self.window)
+            self._wakeup.clear()
+            batch, self._pending = self._pending, []
+            # Process in the background so the next batch can start filling meanwhile
+            task = asyncio.create_task(self._process(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _process(self, batch: list):
+        try:
+            await self._resolve(batch)
+        except Exception as e:
+            logger.error(f"Error processing option risk batch: {e}")
+            for _, _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+        finally:
+            # Never leave a waiter hanging (e.g. when cancelled on shutdown)
+            for _, _, fut in batch:
+                if not fut.done():
+                    fut.cancel()
+
+    async def _qualify_alternatives(self, symbol: str, ticker: str, expiry: str, strike_val: float,
+                                    right: str, currency: str):
+        # For European format, if qualification fails with current currency, try alternatives.
+        # All candidates are qualified concurrently; the first match in preference order wins.
+        alt_currencies = [c for c in ('EUR', 'GBP', 'CHF', 'USD') if c != currency]
+        results = await asyncio.gather(*(
+            qualify_cached(self.client, Option(ticker, expiry, strike_val, right, 'SMART', currency=c))
+            for c in alt_currencies
+        ), return_exceptions=True)
+        for alt_currency, result in zip(alt_currencies, results):
+            if isinstance(result, list) and result[0]:
+                logger.info(f"Found European option with currency {alt_currency}: {symbol}")
+                return result[0]
+        return None
+
+    async def _resolve(self, batch: list):
+        client = self.client
+
+        # 1. Qualify every contract in the batch at once
+        contracts = await qualify_cached(client, *(
+            Option(ticker, expiry, strike_val, right, 'SMART', currency=currency)
+            for _, (ticker, expiry, strike_val, right, currency, _), _ in batch
+        ))
+
+        # Group requests by contract so each one is subscribed only once
+        subscriptions: dict[int, tuple] = {}
+        for contract, (symbol, parsed, fut) in zip(contracts, batch):
+            ticker, expiry, strike_val, right, currency, is_european_format = parsed
+            if not contract and is_european_format:
+                contract = await self._qualify_alternatives(symbol, ticker, expiry, strike_val, right, currency)
+            if not contract:
+                fut.set_exception(HTTPException(status_code=404, detail=f"Option contract not found for {symbol}"))
+                continue
+            subscriptions.setdefault(contract.conId, (contract, []))[1].append((symbol, fut))
+
+        if not subscriptions:
+            return
+
+        # 2. Request Data and wake up as soon as it arrives
         # Delayed data doesn't always arrive instantly in the first snapshot.
-        client.reqMktData(qualified[0], '', False, False)
-        
-        t = None
-
-        for _ in range(50): # Wait up to 5 seconds
-            await asyncio.sleep(0.1)
-            t = client.ticker(qualified[0])
-            if t:
-                # Check if we have some data yet (Greeks or last price)
-                g = t.modelGreeks or t.bidGreeks or t.askGreeks or t.lastGreeks
-                if g or (t.last is not None and not math.isnan(t.last)):
-                    break
-        
-        # Cleanup subscription
-        client.cancelMktData(qualified[0])
-        
-        if not t:
-             raise HTTPException(status_code=404, detail="No market data received after waiting")
-             
-        # Fallback logic: Model -> Bid -> Ask -> Last
-        g = t.modelGreeks or t.bidGreeks or t.askGreeks or t.lastGreeks
-        
-        t_vol = getattr(t, 'volume', None)
-        t_oi = getattr(t, 'openInterest', None)
-        t_last = getattr(t, 'last', None)
-        t_time = getattr(t, 'lastTime', None)
-        
-        return OptionGreeks(
-            symbol=symbol,
-            delta=g.delta if (g and g.delta is not None) else 0.0,
-            gamma=g.gamma if (g and g.gamma is not None) else 0.0,
-            vega=g.vega if (g and g.vega is not None) else 0.0,
-            theta=g.theta if (g and g.theta is not None) else 0.0,
-            implied_vol=g.impliedVol if (g and g.impliedVol is not None) else 0.0,
-            underlying_price=g.undPrice if (g and g.undPrice is not None) else 0.0,
-            volume=int(t_vol) if (t_vol is not None and not math.isnan(t_vol)) else 0,
-            open_interest=int(t_oi) if (t_oi is not None and not math.isnan(t_oi)) else 0,
-            last_price=t_last if (t_last is not None and not math.isnan(t_last)) else 0.0,
-            last_date=t_time.strftime("%Y-%m-%d %H:%M:%S") if t_time else None
+        remaining = dict(subscriptions)
+        data_ready = asyncio.Event()
+        # ib_async keeps Ticker objects (and their old Greeks) after cancelMktData,
+        # so only accept tickers updated after this subscription started
+        started = datetime.now().timestamp()
+
+        def resolve_ready(tickers):
+            for t in tickers:
+                entry = remaining.get(t.contract.conId) if t.contract else None
+                if entry and t.time and t.time.timestamp() >= started and has_option_data(t):
+                    for symbol, fut in entry[1]:
+                        if not fut.done():
+                            fut.set_result(build_option_greeks(symbol, t))
+                    del remaining[t.contract.conId]
+            if not remaining:
+                data_ready.set()
+
+        client.pendingTickersEvent += resolve_ready
+        try:
+            async with ib_semaphore:
+                for contract, _ in subscriptions.values():
+                    client.reqMktData(contract, '', False, False)
+
+                try:
+                    await asyncio.wait_for(data_ready.wait(), timeout=self.timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+            # Timed out: answer with whatever arrived so far
+            for contract, waiters in remaining.values():
+                t = client.ticker(contract)
+                for symbol, fut in waiters:
+                    if fut.done():
+                        continue
+                    if t:
+                        fut.set_result(build_option_greeks(symbol, t))
+                    else:
+                        fut.set_exception(HTTPException(status_code=404, detail="No market data received after waiting"))
+        finally:
+            client.pendingTickersEvent -= resolve_ready
+            # Cleanup subscriptions
+            for contract, _ in subscriptions.values():
+                client.cancelMktData(contract)
+
+
+option_risk_batcher = OptionRiskBatcher(ib)
+
+
+@app.get("/option/risk/{symbol}", response_model=OptionGreeks, dependencies=[Depends(verify_key)])
+async def get_option_risk(symbol: str, client: IB = Depends(require_ib)):
+    """
+    Fetch Greeks for an option symbol (see parse_option_symbol for supported formats).
+
+    Concurrent requests for the same contract share a single market data
+    subscription, and results are reused for OPTION_RISK_CACHE_TTL seconds.
+    Lookups for different contracts are batched by OptionRiskBatcher.
+    """
+    try:
+        symbol = symbol.strip()
+        ticker, expiry, strike_val, right, currency, is_european_format = parse_option_symbol(symbol)
+        key = (ticker, expiry, strike_val, right, currency)
+
+        greeks = await cached_call(
+            _option_risk_cache, _option_risk_inflight, key,
+            partial(option_risk_batcher.submit, symbol, (ticker, expiry, strike_val, right, currency, is_european_format))
         )
+
+        if greeks.symbol != symbol:
+            greeks = greeks.model_copy(update={"symbol": symbol})
+        return greeks
         
     except Exception as e:
         if isinstance(e, HTTPException): raise e
@@ -350,14 +665,13 @@ async def get_option_risk(symbol: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/account/orders", response_model=List[OrderItem], dependencies=[Depends(verify_key)])
-async def get_orders():
-    client = await get_ib()
+async def get_orders(client: IB = Depends(require_ib)):
     # Use reqAllOpenOrdersAsync to see orders from other clients (Mobile app, TWS, etc.)
-    trades = await client.reqAllOpenOrdersAsync()
+    trades = await ib_call(client.reqAllOpenOrdersAsync)
     
     items = []
     for t in trades:
-        items.append(OrderItem(
+        items.append(OrderItem.model_construct(
             orderId=t.order.orderId,
             symbol=t.contract.localSymbol,
             action=t.order.action,
@@ -370,13 +684,12 @@ async def get_orders():
     return items
 
 @app.get("/account/trades", response_model=List[TradeItem], dependencies=[Depends(verify_key)])
-async def get_trades():
-    client = await get_ib()
+async def get_trades(client: IB = Depends(require_ib)):
     logger.info("Fetching executions from IBKR...")
     
     # Request executions for the current session
     exec_filter = ExecutionFilter() 
-    fills = await client.reqExecutionsAsync(exec_filter)
+    fills = await ib_call(client.reqExecutionsAsync, exec_filter)
     
     logger.info(f"reqExecutionsAsync returned {len(fills)} fills")
     
@@ -387,16 +700,13 @@ async def get_trades():
         if fills:
             logger.info(f"Falling back to client.fills(): {len(fills)} found")
 
-    items = []
     # Map execution Id to avoid duplicates if fallback used
-    seen_ids = set()
-    
+    by_id = {}
     for f in fills:
         eid = f.execution.execId
-        if eid in seen_ids: continue
-        seen_ids.add(eid)
+        if eid in by_id: continue
         
-        items.append(TradeItem(
+        by_id[eid] = TradeItem.model_construct(
             executionId=eid,
             symbol=f.contract.localSymbol or f.contract.symbol,
             time=f.time,
@@ -404,16 +714,15 @@ async def get_trades():
             shares=float(f.execution.shares),
             price=f.execution.price,
             orderId=f.execution.orderId
-        ))
+        )
     
     # Sort by time desc
-    items.sort(key=lambda x: x.time, reverse=True)
+    items = sorted(by_id.values(), key=attrgetter('time'), reverse=True)
     logger.info(f"Returning {len(items)} unique trades")
     return items
 
 @app.get("/contract/search", response_model=List[ContractDetailsItem], dependencies=[Depends(verify_key)])
-async def search_contract(symbol: str, secType: str = "STK"):
-    client = await get_ib()
+async def search_contract(symbol: str, secType: str = "STK", client: IB = Depends(require_ib)):
     
     # Parse symbol for international stocks (e.g., BATS.L -> LSE/GBP)
     ticker, exchange, currency = parse_symbol(symbol)
@@ -428,7 +737,11 @@ async def search_contract(symbol: str, secType: str = "STK"):
 
          
     try:
-        details = await client.reqContractDetailsAsync(contract)
+        details = await cached_call(
+            _details_cache, _details_inflight,
+            (contract.symbol, contract.secType, contract.exchange, contract.currency),
+            partial(ib_call, client.reqContractDetailsAsync, contract)
+        )
     except Exception as e:
         logger.error(f"Error fetching contract details for {symbol}: {e}")
         details = []
@@ -439,9 +752,10 @@ async def search_contract(symbol: str, secType: str = "STK"):
         c = d.contract
         
         # 1. Get ISIN if available (secIdList is in ContractDetails, TagValue has 'tag' and 'value')
-        isin = next((id.value for id in d.secIdList if id.tag == 'ISIN'), None) if d.secIdList else None
+        sec_ids = {s.tag: s.value for s in (d.secIdList or ())}
+        isin = sec_ids.get('ISIN')
         
-        items.append(ContractDetailsItem(
+        items.append(ContractDetailsItem.model_construct(
             conId=c.conId,
             symbol=c.symbol,
             secType=c.secType,
@@ -456,25 +770,20 @@ async def search_contract(symbol: str, secType: str = "STK"):
     return items
 
 @app.get("/market/snapshot/{symbol}", response_model=MarketSnapshot, dependencies=[Depends(verify_key)])
-async def get_market_snapshot(symbol: str):
-    client = await get_ib()
-    client.reqMarketDataType(4)
-    
+async def get_market_snapshot(symbol: str, client: IB = Depends(require_ib)):
     # Parse symbol for international stocks (e.g., BATS.L -> LSE/GBP)
     ticker, exchange, currency = parse_symbol(symbol)
     contract = Contract(symbol=ticker, secType="STK", exchange=exchange, currency=currency)
 
     
-    qualified = await client.qualifyContractsAsync(contract)
-    if not qualified:
+    contract = (await qualify_cached(client, contract))[0]
+    if not contract:
         raise HTTPException(status_code=404, detail="Contract not found")
-        
-    contract = qualified[0]
     
     # Use reqTickersAsync. Note: ib_async expects contracts as positional arguments (*args)
     logger.info(f"Requesting ticker for contract: {contract}")
     try:
-        tickers = await client.reqTickersAsync(contract)
+        tickers = await ib_call(client.reqTickersAsync, contract)
         if not tickers:
             raise HTTPException(status_code=504, detail="No market data received from IBKR")
         t = tickers[0]
@@ -488,10 +797,10 @@ async def get_market_snapshot(symbol: str):
     # 3. Try bid/ask midpoint
     # 4. Try close
     
-    v_last = t.last if (t.last is not None and not math.isnan(t.last)) else None
-    v_bid = t.bid if (t.bid is not None and not math.isnan(t.bid)) else None
-    v_ask = t.ask if (t.ask is not None and not math.isnan(t.ask)) else None
-    v_close = t.close if (t.close is not None and not math.isnan(t.close)) else None
+    v_last = _num(t.last, None)
+    v_bid = _num(t.bid, None)
+    v_ask = _num(t.ask, None)
+    v_close = _num(t.close, None)
     
     price = v_last
     if price is None:
@@ -513,33 +822,31 @@ async def get_market_snapshot(symbol: str):
     )
 
 @app.get("/options/chain/{symbol}", response_model=List[OptionChainItem], dependencies=[Depends(verify_key)])
-async def get_option_chain(symbol: str):
+async def get_option_chain(symbol: str, client: IB = Depends(require_ib)):
     """
     Get available option expirations and strikes for a given underlying symbol.
     Returns option chain parameters from IBKR.
     """
-    client = await get_ib()
     
     # Parse symbol for international stocks (e.g., BATS.L -> LSE/GBP)
     ticker, exchange, currency = parse_symbol(symbol)
     
-    # First, qualify the underlying contract
-    contract = Contract(symbol=ticker, secType="STK", exchange=exchange, currency=currency)
-    qualified = await client.qualifyContractsAsync(contract)
-    if not qualified:
+    # First, qualify the underlying contract.
+    # SMART can be ambiguous for some US symbols; only then fall back to the
+    # primary venues (concurrently), taking the first match in preference order.
+    underlying, = await qualify_cached(client, Contract(symbol=ticker, secType="STK", exchange=exchange, currency=currency))
+    if not underlying and exchange == "SMART":
+        fallbacks = await qualify_cached(client, *(
+            Contract(symbol=ticker, secType="STK", exchange=exch, currency=currency)
+            for exch in UNDERLYING_VENUES[1:]
+        ))
+        underlying = next(filter(None, fallbacks), None)
+    if not underlying:
         raise HTTPException(status_code=404, detail=f"Underlying {symbol} not found")
-
-    
-    underlying = qualified[0]
     
     # Get option chain parameters
     try:
-        chains = await client.reqSecDefOptParamsAsync(
-            underlying.symbol,
-            "",  # futFopExchange (empty for stocks)
-            underlying.secType,
-            underlying.conId
-        )
+        chains = await sec_def_opt_params_cached(client, underlying)
     except Exception as e:
         logger.error(f"Error fetching option chain for {symbol}: {e}")
         raise HTTPException(status_code=500, detail=f"Error fetching option chain: {e}")
@@ -549,11 +856,11 @@ async def get_option_chain(symbol: str):
     
     items = []
     for chain in chains:
-        # Sort expirations and strikes for cleaner output
-        expirations = sorted(chain.expirations) if chain.expirations else []
-        strikes = sorted(chain.strikes) if chain.strikes else []
+        # Sort (and de-duplicate) expirations and strikes for cleaner output
+        expirations = sorted(set(chain.expirations or ()))
+        strikes = sorted(set(chain.strikes or ()))
         
-        items.append(OptionChainItem(
+        items.append(OptionChainItem.model_construct(
             exchange=chain.exchange,
             underlyingConId=chain.underlyingConId,
             tradingClass=chain.tradingClass,
@@ -1,11 +1,19 @@
 import asyncio
 import logging
+import random
+import re
+import threading
 import httpx
-from datetime import datetime, timedelta
-from aiogram import Bot, Dispatcher, types, F
+import orjson
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from itertools import groupby
+from aiogram import BaseMiddleware, Bot, Dispatcher, types, F
 from aiogram.filters import Command
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from sqlalchemy import create_engine, func
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.exc import DataError, IntegrityError, OperationalError
 from sqlalchemy.orm import sessionmaker
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from src.flex import FlexReporter
@@ -17,11 +25,22 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("ibkr-bot")
 
 # DB Setup
-engine = create_engine(settings.DB_URL)
-SessionLocal = sessionmaker(bind=engine)
+@lru_cache(maxsize=1)
+def get_engine():
+    # pool_pre_ping: the bot idles between ticks and the DB may drop idle connections
+    return create_engine(settings.DB_URL, query_cache_size=1200, pool_pre_ping=True)
 
-# Ensure tables exist
-Base.metadata.create_all(engine)
+@lru_cache(maxsize=1)
+def get_sessionmaker():
+    return sessionmaker(bind=get_engine())
+
+def init_db():
+    """Ensure tables and indexes exist. Called once at startup."""
+    engine = get_engine()
+    Base.metadata.create_all(engine)
+    # create_all skips indexes on tables that already exist
+    for index in CashBalance.__table__.indexes:
+        index.create(engine, checkfirst=True)
 
 # Validate required settings
 if not settings.TELEGRAM_TOKEN:
@@ -36,15 +55,41 @@ bot = Bot(token=settings.TELEGRAM_TOKEN)
 dp = Dispatcher()
 
 
+class AuthMiddleware(BaseMiddleware):
+    """Drop updates from users not in TELEGRAM_ALLOWED_IDS before any filter or handler runs."""
+    async def __call__(self, handler, event: types.TelegramObject, data: dict):
+        # Messages and callback queries both carry the sender in from_user
+        user = getattr(event, "from_user", None)
+        if user is None or user.id not in settings.allowed_ids_set:
+            return None
+        return await handler(event, data)
+
+# Outer middleware runs before command filters, so unauthorized updates cost one set lookup
+dp.message.outer_middleware(AuthMiddleware())
+dp.callback_query.outer_middleware(AuthMiddleware())
+
+
 async def notify_admins(text: str, parse_mode: str = "Markdown"):
-    for chat_id in settings.allowed_ids_list:
-        try:
-            await bot.send_message(chat_id, text, parse_mode=parse_mode)
-        except Exception as e:
-            logger.error(f"Failed to notify admin {chat_id}: {e}")
+    chat_ids = settings.allowed_ids_list
+    results = await asyncio.gather(
+        *(bot.send_message(chat_id, text, parse_mode=parse_mode) for chat_id in chat_ids),
+        return_exceptions=True
+    )
+    for chat_id, result in zip(chat_ids, results):
+        if isinstance(result, Exception):
+            logger.error(f"Failed to notify admin {chat_id}: {result}")
 
 API_HEADERS = {"X-API-Key": settings.API_KEY}
 
+# Shared HTTP client for the companion API: keeps connections alive across
+# handlers and scheduler jobs instead of reconnecting on every request
+api_client = httpx.AsyncClient(
+    base_url=settings.WEB_SERVICE_URL,
+    headers=API_HEADERS,
+    timeout=30.0,
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=30.0)
+)
+
 # Constants
 EMOJI_MAP = {
     "EUR": "💶", 
@@ -53,6 +98,211 @@ EMOJI_MAP = {
     "CHF": "🇨🇭", 
     "SEK": "🇸🇪"
 }
+_EMOJI_GET = EMOJI_MAP.get
+
+# IB expiry dates (YYYYMMDD)
+_YYYYMMDD = re.compile(r'(\d{4})(\d{2})(\d{2})')
+
+# /nav message, filled from the /account/summary payload
+NAV_TEMPLATE = "\n".join([
+    "<code>💰 NAV:      {NetLiquidation:>+12.2f}</code>",
+    "<code>📈 Stock:    {StockMarketValue:>+12.2f}</code>",
+    "<code>📊 Pnl:      {UnrealizedPnL:>+12.2f}</code>",
+    "-------------------",
+    "<code>📆 Day Pnl:  {DailyPnL:>+12.2f}</code>",
+    "<code>📅 Day Rlz:  {DailyRealizedPnL:>+12.2f}</code>",
+    "-------------------",
+    "<code>💵 Base:     {TotalCashValue:>+12.2f}</code>",
+    "<code>💶 EUR:      {EUR:>+12.2f}</code>",
+    "<code>💵 USD:      {USD:>+12.2f}</code>",
+    "<code>💷 GBP:      {GBP:>+12.2f}</code>",
+    "-------------------",
+    "<code>🛡️ Cushion:  {Cushion:>12.6f}</code>",
+    "<code>🚀 BuyPwr:   {BuyingPower:>12.2f}</code>",
+    "<code>💧 exLiq:    {ExcessLiquidity:>12.2f}</code>",
+    "<code>🧱 margin:   {FullMaintMargin:>12.2f}</code>",
+])
+
+# Currencies watched for cash balance changes, in _cash_fields order
+CASH_ALERT_CURRENCIES = ("EUR", "USD", "GBP")
+
+# Cash balances (eur, usd, gbp) of the last inserted record. This process is the
+# only writer, so it is loaded from the DB once at startup and updated after each insert.
+# _LAST_RECORD and _PENDING are used from asyncio.to_thread workers: hold _DB_LOCK
+# to read or change them, never across DB round-trips.
+_DB_LOCK = threading.Lock()
+_LAST_RECORD: tuple[float, float, float] | None = None
+
+def _cash_fields(record) -> tuple[float, float, float]:
+    """Compared cash fields of a record, rounded like the Numeric(18, 4) columns."""
+    return (
+        round(float(record.eur or 0.0), 4),
+        round(float(record.usd or 0.0), 4),
+        round(float(record.gbp or 0.0), 4),
+    )
+
+def _load_last_record():
+    """Populate _LAST_RECORD from the DB. Blocking DB I/O."""
+    global _LAST_RECORD
+    session = get_sessionmaker()()
+    try:
+        last_record = session.execute(
+            select(CashBalance.eur, CashBalance.usd, CashBalance.gbp)
+            .order_by(CashBalance.date.desc()).limit(1)
+        ).first()
+        with _DB_LOCK:
+            _LAST_RECORD = _cash_fields(last_record) if last_record else None
+    finally:
+        session.close()
+
+# Rows whose insert failed because the DB was unreachable, replayed with the next insert
+_PENDING: list[dict] = []
+PENDING_MAX = 100
+
+def _insert_rows(rows: list[dict]) -> tuple[list[dict], list[dict], OperationalError | None]:
+    """
+    Insert rows with a Core executemany. Returns (written, dropped, error): error is
+    the OperationalError that stopped the insert, in which case the rows that are
+    neither written nor dropped are still unsaved.
+    Blocking DB I/O, done without holding _DB_LOCK.
+    """
+    session = get_sessionmaker()()
+    written, dropped = [], []
+    try:
+        try:
+            session.execute(insert(CashBalance), rows)
+            session.commit()
+            return rows, [], None
+        except (DataError, IntegrityError):
+            # The DB rejected a row (e.g. an out-of-range value); insert one by one
+            # so only the bad rows are dropped instead of blocking every later insert
+            session.rollback()
+            for row in rows:
+                try:
+                    session.execute(insert(CashBalance), [row])
+                    session.commit()
+                    written.append(row)
+                except (DataError, IntegrityError) as e:
+                    session.rollback()
+                    logger.error(f"DB rejected record from {row['date']}, dropping it: {e}")
+                    dropped.append(row)
+            return written, dropped, None
+    except OperationalError as e:
+        session.rollback()
+        return written, dropped, e
+    finally:
+        session.close()
+
+def _archive_sync(summary: dict, curr_map: dict, force_insert: bool) -> list[str]:
+    """
+    Compare current balances with the last record and insert a new record
+    when cash changed (or force_insert is set). Returns the alert lines.
+    Blocking DB I/O: run it via asyncio.to_thread.
+    """
+    global _LAST_RECORD
+    try:
+        # Previous cash balance for change detection
+        with _DB_LOCK:
+            last_record = _LAST_RECORD
+    
+        # New row; the date is set here so a replayed row keeps its own timestamp
+        row = {
+            'date': datetime.now(),
+            'nav': summary['NetLiquidation'],
+            'stock': summary['StockMarketValue'],
+            'pnl': summary['UnrealizedPnL'],
+            'base': summary['TotalCashValue'],
+            'eur': curr_map.get('EUR', 0.0),
+            'usd': curr_map.get('USD', 0.0),
+            'gbp': curr_map.get('GBP', 0.0),
+            'chf': curr_map.get('CHF', 0.0),
+            'sek': curr_map.get('SEK', 0.0),
+            'cushion': summary['Cushion'],
+            'buyingPower': summary['BuyingPower'],
+            'excessLiq': summary['ExcessLiquidity'],
+            'maintMargin': summary['FullMaintMargin'],
+        }
+        new_vals = (
+            float(row['eur'] or 0.0),
+            float(row['usd'] or 0.0),
+            float(row['gbp'] or 0.0),
+        )
+    
+        # Check for alerts using the previous record
+        alerts = []
+        cash_changed = False
+        if last_record:
+            for curr, old_val, new_val in zip(CASH_ALERT_CURRENCIES, last_record, new_vals):
+                if new_val != old_val:
+                    cash_changed = True
+                    diff = new_val - old_val
+                    sign = "+" if diff > 0 else "-"
+                    abs_diff = abs(diff)
+                
+                    # Emoji mapping
+                    emoji = _EMOJI_GET(curr, "💰")
+                
+                    alert = (
+                        f"<code>{curr} {emoji} {diff:+.4f}</code>\n"
+                        f"<code>{old_val:.4f} {sign} {abs_diff:.4f} = {new_val:.4f}</code>"
+                    )
+                    alerts.append(alert)
+    except Exception as e:
+        logger.error(f"Snapshot Logic Error: {e}")
+        return []
+    
+    # Only insert to DB if:
+    # 1. Cash balance has changed, OR
+    # 2. force_insert is True (periodic snapshot)
+    should_insert = cash_changed or force_insert
+
+    if not should_insert:
+        logger.debug("No DB insert - no cash changes detected")
+        return alerts
+
+    # Take the pending rows plus this one out of _PENDING so a concurrent worker
+    # never writes them twice. The row becomes the "last record" right away so
+    # the next tick does not re-alert; it is rolled back below if the row is lost.
+    new_record = tuple(round(v, 4) for v in new_vals)
+    with _DB_LOCK:
+        _PENDING.append(row)
+        del _PENDING[:-PENDING_MAX]
+        batch = _PENDING[:]
+        _PENDING.clear()
+        prev_record = _LAST_RECORD
+        _LAST_RECORD = new_record
+
+    row_lost = False
+    try:
+        written, dropped, error = _insert_rows(batch)
+        row_lost = any(r is row for r in dropped)
+        if error is not None:
+            # Connection-level failure: keep the unsaved rows and replay them with the next insert
+            done = {id(r) for r in written} | {id(r) for r in dropped}
+            with _DB_LOCK:
+                _PENDING[:0] = [r for r in batch if id(r) not in done]
+                del _PENDING[:-PENDING_MAX]
+                pending = len(_PENDING)
+            logger.error(f"DB Error ({pending} rows pending): {error}")
+        if len(written) > 1:
+            logger.info(f"DB records inserted ({len(written) - 1} replayed)")
+        elif written and cash_changed:
+            logger.info("DB record inserted due to cash balance change")
+        elif written:
+            logger.info("DB record inserted (periodic snapshot)")
+    except Exception as e:
+        # Anything else would fail the same way on replay
+        logger.error(f"DB Error, dropping {len(batch)} pending rows: {e}")
+        row_lost = True
+
+    if row_lost:
+        # Never stored: keep diffing against the previous balance, unless a
+        # later worker has already moved the last record on
+        with _DB_LOCK:
+            if _LAST_RECORD is new_record:
+                _LAST_RECORD = prev_record
+
+    return alerts
 
 async def check_and_archive(force_insert: bool = False):
     """
@@ -65,235 +315,144 @@ async def check_and_archive(force_insert: bool = False):
     log_suffix = " (forced DB insert)" if force_insert else ""
     logger.info(f"Running monitoring check{log_suffix}...")
     try:
-        async with httpx.AsyncClient(timeout=30) as client:
-            # 1. Fetch Summary
-            r_sum = await client.get(f"{settings.WEB_SERVICE_URL}/account/summary", headers=API_HEADERS)
-            if r_sum.status_code != 200:
-                logger.warning(f"Failed to fetch summary: {r_sum.status_code}")
-                return
-            
-            summary = r_sum.json()
-            
-            # 2. Fetch Currencies
-            r_curr = await client.get(f"{settings.WEB_SERVICE_URL}/account/currencies", headers=API_HEADERS)
-            currencies = r_curr.json() if r_curr.status_code == 200 else []
-
-            # 3. DB Operations
-            session = SessionLocal()
-            try:
-                # Map currencies for quick lookup
-                curr_map = {c['currency']: c['amount'] for c in currencies}
-                
-                # Get previous cash balance for change detection
-                last_record = session.query(CashBalance).order_by(CashBalance.date.desc()).first()
-                
-                # Create new record (but don't add to session yet)
-                new_record = CashBalance(
-                    nav=summary['NetLiquidation'], 
-                    stock=summary['StockMarketValue'],
-                    pnl=summary['UnrealizedPnL'],
-                    base=summary['TotalCashValue'],
-                    eur=curr_map.get('EUR', 0.0),
-                    usd=curr_map.get('USD', 0.0),
-                    gbp=curr_map.get('GBP', 0.0),
-                    chf=curr_map.get('CHF', 0.0),
-                    sek=curr_map.get('SEK', 0.0),
-                    cushion=summary['Cushion'],
-                    buyingPower=summary['BuyingPower'],
-                    excessLiq=summary['ExcessLiquidity'],
-                    maintMargin=summary['FullMaintMargin']
-                )
-                
-                # Check for alerts using the previous record
-                alerts = []
-                cash_changed = False
-                if last_record:
-                    for curr in ['eur', 'usd', 'gbp']:
-                        old_val = float(getattr(last_record, curr) or 0.0)
-                        new_val = float(getattr(new_record, curr) or 0.0)
-                        
-                        if new_val != old_val:
-                            cash_changed = True
-                            diff = new_val - old_val
-                            sign = "+" if diff > 0 else "-"
-                            abs_diff = abs(diff)
-                            
-                            # Emoji mapping
-                            curr_upper = curr.upper()
-                            emoji = EMOJI_MAP.get(curr_upper, "💰")
-                            
-                            alert = (
-                                f"<code>{curr_upper} {emoji} {diff:+.4f}</code>\n"
-                                f"<code>{old_val:.4f} {sign} {abs_diff:.4f} = {new_val:.4f}</code>"
-                            )
-                            alerts.append(alert)
-                
-                # Only insert to DB if:
-                # 1. Cash balance has changed, OR
-                # 2. force_insert is True (periodic snapshot)
-                should_insert = cash_changed or force_insert
-                
-                if should_insert:
-                    session.add(new_record)
-                    session.commit()
-                    if cash_changed:
-                        logger.info("DB record inserted due to cash balance change")
-                    else:
-                        logger.info("DB record inserted (periodic snapshot)")
-                else:
-                    logger.debug("No DB insert - no cash changes detected")
-                
-                if alerts:
-                    await notify_admins(
-                        "💰 <b>Cash balance change:</b>\n" + "\n".join(alerts),
-                        parse_mode="HTML"
-                    )
-                    
-            except Exception as e:
-                logger.error(f"DB/Logic Error: {e}")
-                session.rollback()
-            finally:
-                session.close()
+        # 1. Fetch Summary and Currencies concurrently
+        r_sum, r_curr = await asyncio.gather(
+            api_client.get("/account/summary"),
+            api_client.get("/account/currencies")
+        )
+        if r_sum.status_code != 200:
+            logger.warning(f"Failed to fetch summary: {r_sum.status_code}")
+            return
+        
+        summary = orjson.loads(r_sum.content)
+        currencies = orjson.loads(r_curr.content) if r_curr.status_code == 200 else []
+
+        # Map currencies for quick lookup
+        curr_map = {c['currency']: c['amount'] for c in currencies}
+
+        # 2. DB Operations (in a worker thread to keep the event loop responsive)
+        alerts = await asyncio.to_thread(_archive_sync, summary, curr_map, force_insert)
+        
+        if alerts:
+            await notify_admins(
+                "💰 <b>Cash balance change:</b>\n" + "\n".join(alerts),
+                parse_mode="HTML"
+            )
 
     except Exception as e: 
         logger.error(f"Monitoring Job Error: {e}")
 
 @dp.message(Command("nav", ignore_case=True))
 async def cmd_nav(m: types.Message):
-    if m.from_user.id not in settings.allowed_ids_list: return
-    
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        try:
-            r = await client.get(f"{settings.WEB_SERVICE_URL}/account/summary", headers=API_HEADERS)
-            r.raise_for_status()
-            d = r.json()
-            
-            # Format with entire lines in inline code (monospace without blue box)
-            msg = f"<code>💰 NAV:      {d['NetLiquidation']:>+12.2f}</code>\n"
-            msg += f"<code>📈 Stock:    {d['StockMarketValue']:>+12.2f}</code>\n"
-            msg += f"<code>📊 Pnl:      {d['UnrealizedPnL']:>+12.2f}</code>\n"
-            msg += "-------------------\n"
-            msg += f"<code>📆 Day Pnl:  {d['DailyPnL']:>+12.2f}</code>\n"
-            msg += f"<code>📅 Day Rlz:  {d['DailyRealizedPnL']:>+12.2f}</code>\n"
-            msg += "-------------------\n"
-            msg += f"<code>💵 Base:     {d['TotalCashValue']:>+12.2f}</code>\n"
-            msg += f"<code>💶 EUR:      {d['EUR']:>+12.2f}</code>\n"
-            msg += f"<code>💵 USD:      {d['USD']:>+12.2f}</code>\n"
-            msg += f"<code>💷 GBP:      {d['GBP']:>+12.2f}</code>\n"
-            msg += "-------------------\n"
-            msg += f"<code>🛡️ Cushion:  {d['Cushion']:>12.6f}</code>\n"
-            msg += f"<code>🚀 BuyPwr:   {d['BuyingPower']:>12.2f}</code>\n"
-            msg += f"<code>💧 exLiq:    {d['ExcessLiquidity']:>12.2f}</code>\n"
-            msg += f"<code>🧱 margin:   {d['FullMaintMargin']:>12.2f}</code>"
-
-            
-            await m.answer(msg, parse_mode="HTML")
-        except httpx.HTTPStatusError as e:
-            err_detail = e.response.text or str(e)
-            logger.error(f"HTTP Error in /nav: {err_detail}")
-            await m.answer(f"❌ API Error: {err_detail}")
-        except Exception as e:
-            logger.error(f"Error in /nav: {e}", exc_info=True)
-            msg = str(e) or repr(e)
-            await m.answer(f"❌ Error: {msg}")
+    try:
+        r = await api_client.get("/account/summary")
+        r.raise_for_status()
+        d = orjson.loads(r.content)
+        
+        # Format with entire lines in inline code (monospace without blue box)
+        msg = NAV_TEMPLATE.format_map(d)
+        
+        await m.answer(msg, parse_mode="HTML")
+    except httpx.HTTPStatusError as e:
+        err_detail = e.response.text or str(e)
+        logger.error(f"HTTP Error in /nav: {err_detail}")
+        await m.answer(f"❌ API Error: {err_detail}")
+    except Exception as e:
+        logger.error(f"Error in /nav: {e}", exc_info=True)
+        msg = str(e) or repr(e)
+        await m.answer(f"❌ Error: {msg}")
 
 @dp.message(Command("pos", ignore_case=True))
 async def cmd_pos(m: types.Message):
-    if m.from_user.id not in settings.allowed_ids_list: return
-    
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        try:
-            r = await client.get(f"{settings.WEB_SERVICE_URL}/account/positions", headers=API_HEADERS)
-            r.raise_for_status()
-            positions = r.json()
-            
-            if not positions:
-                await m.answer("📭 No open positions.")
-                return
+    try:
+        r = await api_client.get("/account/positions")
+        r.raise_for_status()
+        positions = orjson.loads(r.content)
+        
+        if not positions:
+            await m.answer("📭 No open positions.")
+            return
 
-            # Separate stocks and options, sort alphabetically
-            stocks = sorted([p for p in positions if p.get('secType') != 'OPT'], key=lambda x: x['symbol'])
-            options = sorted([p for p in positions if p.get('secType') == 'OPT'], key=lambda x: x['symbol'])
-            
-            # Stocks table (8-char symbol width)
-            if stocks:
-                header = "Symbol  | Pos.  | Avg\n"
-                header += "--------|-------|-------------\n"
-                
-                rows = []
-                for p in stocks:
-                    sym = str(p['symbol']).ljust(8)
-                    qty = str(p['qty']).ljust(6)
-                    cost = f"{p['cost']:.4f}"
-                    rows.append(f"{sym}| {qty}| {cost}")
-                
-                msg = "� *Stocks*\n\n```\n" + header + "\n".join(rows) + "\n```"
-                await m.answer(msg, parse_mode="Markdown")
+        # Separate stocks and options, sort alphabetically
+        stocks = sorted([p for p in positions if p.get('secType') != 'OPT'], key=lambda x: x['symbol'])
+        options = sorted([p for p in positions if p.get('secType') == 'OPT'], key=lambda x: x['symbol'])
+        
+        # Stocks table (8-char symbol width)
+        if stocks:
+            rows = (f"{p['symbol']:<8}| {str(p['qty']):<6}| {p['cost']:.4f}" for p in stocks)
             
-            # Options table (20-char symbol width, spaces removed)
-            if options:
-                header = "Symbol              | Pos.  | Avg\n"
-                header += "--------------------|-------|-------------\n"
-                
-                rows = []
-                for p in options:
-                    # Remove spaces from option symbols for compact display
-                    sym = str(p['symbol']).replace(' ', '').ljust(20)
-                    qty = str(p['qty']).ljust(6)
-                    cost = f"{p['cost']:.4f}"
-                    rows.append(f"{sym}| {qty}| {cost}")
-                
-                msg = "📋 *Options*\n\n```\n" + header + "\n".join(rows) + "\n```"
-                await m.answer(msg, parse_mode="Markdown")
+            msg = "\n".join([
+                "� *Stocks*\n",
+                "```",
+                "Symbol  | Pos.  | Avg",
+                "--------|-------|-------------",
+                *rows,
+                "```",
+            ])
+            await m.answer(msg, parse_mode="Markdown")
+        
+        # Options table (20-char symbol width, spaces removed)
+        if options:
+            # Remove spaces from option symbols for compact display
+            rows = (
+                f"{p['symbol'].replace(' ', ''):<20}| {str(p['qty']):<6}| {p['cost']:.4f}"
+                for p in options
+            )
             
-        except httpx.HTTPStatusError as e:
-            err_detail = e.response.text or str(e)
-            logger.error(f"HTTP Error in /pos: {err_detail}")
-            await m.answer(f"❌ API Error: {err_detail}")
-        except Exception as e:
-            logger.error(f"Error in /pos: {e}", exc_info=True)
-            msg = str(e) or repr(e)
-            await m.answer(f"❌ Error: {msg}")
+            msg = "\n".join([
+                "📋 *Options*\n",
+                "```",
+                "Symbol              | Pos.  | Avg",
+                "--------------------|-------|-------------",
+                *rows,
+                "```",
+            ])
+            await m.answer(msg, parse_mode="Markdown")
+        
+    except httpx.HTTPStatusError as e:
+        err_detail = e.response.text or str(e)
+        logger.error(f"HTTP Error in /pos: {err_detail}")
+        await m.answer(f"❌ API Error: {err_detail}")
+    except Exception as e:
+        logger.error(f"Error in /pos: {e}", exc_info=True)
+        msg = str(e) or repr(e)
+        await m.answer(f"❌ Error: {msg}")
+
+def _option_expiry_label(opt: dict) -> str:
+    """Expiry of a position for display: YYYYMMDD -> YYYY-MM-DD, anything else as-is."""
+    curr_expiry = opt.get('expiry')
+    match = _YYYYMMDD.fullmatch(curr_expiry) if curr_expiry else None
+    if match:
+        return f"{match[1]}-{match[2]}-{match[3]}"
+    return curr_expiry or "Unknown"
 
 @dp.message(Command("options", ignore_case=True))
 async def cmd_options(m: types.Message):
-    if m.from_user.id not in settings.allowed_ids_list: return
-    
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        try:
-            r = await client.get(f"{settings.WEB_SERVICE_URL}/account/positions", headers=API_HEADERS)
-            r.raise_for_status()
-            positions = r.json()
-            
-            # Filter for options
-            options = [p for p in positions if p.get('secType') == 'OPT']
-            
-            if not options:
-                await m.answer("📭 No open option positions.")
-                return
+    try:
+        r = await api_client.get("/account/positions")
+        r.raise_for_status()
+        positions = orjson.loads(r.content)
+        
+        # Filter for options
+        options = [p for p in positions if p.get('secType') == 'OPT']
+        
+        if not options:
+            await m.answer("📭 No open option positions.")
+            return
 
-            # Sort by expiry (ascending), then underlying symbol
-            options.sort(key=lambda x: (x.get('expiry') or "", x.get('underlying') or ""))
+        # Sort by expiry (ascending), then underlying symbol
+        options.sort(key=lambda x: (x.get('expiry') or "", x.get('underlying') or ""))
 
-            builder = InlineKeyboardBuilder()
-            
-            last_expiry = None
-            for opt in options:
-                curr_expiry = opt.get('expiry')
-                # Format expiry for readability if it's YYYYMMDD
-                if curr_expiry and len(curr_expiry) == 8 and curr_expiry.isdigit():
-                    formatted_expiry = f"{curr_expiry[0:4]}-{curr_expiry[4:6]}-{curr_expiry[6:8]}"
-                else:
-                    formatted_expiry = curr_expiry or "Unknown"
-
-                # Add a header button (not clickable or for info) if expiry changes
-                if formatted_expiry != last_expiry:
-                    builder.row(types.InlineKeyboardButton(
-                        text=f"📅 {formatted_expiry}",
-                        callback_data="noop"
-                    ))
-                    last_expiry = formatted_expiry
+        builder = InlineKeyboardBuilder()
+        
+        # One header button (not clickable or for info) per expiry, then its options
+        for formatted_expiry, group in groupby(options, key=_option_expiry_label):
+            builder.row(types.InlineKeyboardButton(
+                text=f"📅 {formatted_expiry}",
+                callback_data="noop"
+            ))
 
+            for opt in group:
                 # Format Label: ASTS P 55 2026-01-09
                 underlying = opt.get('underlying', "??")
                 right = opt.get('right', "?")
@@ -305,179 +464,182 @@ async def cmd_options(m: types.Message):
                     text=f"{label} ({opt['qty']})",
                     callback_data=f"opt_details:{opt['symbol'].strip()}"
                 ))
-            
-            await m.answer("📑 *Open Option Positions*", 
-                           reply_markup=builder.as_markup(), 
-                           parse_mode="Markdown")
-                           
-        except httpx.HTTPStatusError as e:
-            err_detail = e.response.text or str(e)
-            logger.error(f"HTTP Error in /options: {err_detail}")
-            await m.answer(f"❌ API Error: {err_detail}")
-        except Exception as e:
-            logger.error(f"Error in /options: {e}", exc_info=True)
-            msg = str(e) or repr(e)
-            await m.answer(f"❌ Error: {msg}")
+        
+        await m.answer("📑 *Open Option Positions*", 
+                       reply_markup=builder.as_markup(), 
+                       parse_mode="Markdown")
+                       
+    except httpx.HTTPStatusError as e:
+        err_detail = e.response.text or str(e)
+        logger.error(f"HTTP Error in /options: {err_detail}")
+        await m.answer(f"❌ API Error: {err_detail}")
+    except Exception as e:
+        logger.error(f"Error in /options: {e}", exc_info=True)
+        msg = str(e) or repr(e)
+        await m.answer(f"❌ Error: {msg}")
 
 @dp.callback_query(F.data.startswith("opt_details:"))
 async def process_opt_details(callback: types.CallbackQuery):
     symbol = callback.data.split(":")[1]
     
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        try:
-            r = await client.get(f"{settings.WEB_SERVICE_URL}/option/risk/{symbol}", headers=API_HEADERS)
-            r.raise_for_status()
-            d = r.json()
-            
-            # Format using requested fields and emojis
-            msg = (
-                f"📊 *Option Details: {symbol}*\n\n"
-                f"🧮 *Greeks:*\n"
-                f"• Δ Delta: `{d['delta']:.4f}`\n"
-                f"• γ Gamma: `{d['gamma']:.4f}`\n"
-                f"• ν Vega: `{d['vega']:.4f}`\n"
-                f"• θ Theta: `{d['theta']:.4f}`\n\n"
-                f"📈 *Market Data:*\n"
-                f"• IV: `{d['implied_vol']*100:.2f}%`\n"
-                f"• Underl. Price: `{d['underlying_price']:.2f}`\n"
-                f"• Volume: `{d['volume']}`\n"
-                f"• Open Interest: `{d['open_interest']}`\n\n"
-                f"💰 *Last Trade:*\n"
-                f"• Price: `{d['last_price']:.2f}`\n"
-                f"• Date: `{d['last_date'] or 'N/A'}`"
-            )
-            
-            await callback.message.answer(msg, parse_mode="Markdown")
-            await callback.answer()
-            
-        except httpx.HTTPStatusError as e:
-            err_detail = e.response.text or str(e)
-            logger.error(f"HTTP Error in /options callback: {err_detail}")
-            await callback.message.answer(f"❌ API Error: {err_detail}")
-            await callback.answer()
-        except Exception as e:
-            logger.error(f"Error in /options callback: {e}", exc_info=True)
-            msg = str(e) or repr(e)
-            await callback.message.answer(f"❌ Error fetching details: {msg}")
-            await callback.answer()
+    try:
+        r = await api_client.get(f"/option/risk/{symbol}")
+        r.raise_for_status()
+        d = orjson.loads(r.content)
+        
+        # Format using requested fields and emojis
+        msg = (
+            f"📊 *Option Details: {symbol}*\n\n"
+            f"🧮 *Greeks:*\n"
+            f"• Δ Delta: `{d['delta']:.4f}`\n"
+            f"• γ Gamma: `{d['gamma']:.4f}`\n"
+            f"• ν Vega: `{d['vega']:.4f}`\n"
+            f"• θ Theta: `{d['theta']:.4f}`\n\n"
+            f"📈 *Market Data:*\n"
+            f"• IV: `{d['implied_vol']*100:.2f}%`\n"
+            f"• Underl. Price: `{d['underlying_price']:.2f}`\n"
+            f"• Volume: `{d['volume']}`\n"
+            f"• Open Interest: `{d['open_interest']}`\n\n"
+            f"💰 *Last Trade:*\n"
+            f"• Price: `{d['last_price']:.2f}`\n"
+            f"• Date: `{d['last_date'] or 'N/A'}`"
+        )
+        
+        await callback.message.answer(msg, parse_mode="Markdown")
+        await callback.answer()
+        
+    except httpx.HTTPStatusError as e:
+        err_detail = e.response.text or str(e)
+        logger.error(f"HTTP Error in /options callback: {err_detail}")
+        await callback.message.answer(f"❌ API Error: {err_detail}")
+        await callback.answer()
+    except Exception as e:
+        logger.error(f"Error in /options callback: {e}", exc_info=True)
+        msg = str(e) or repr(e)
+        await callback.message.answer(f"❌ Error fetching details: {msg}")
+        await callback.answer()
 
 
 
+def _max_nav_sync():
+    """Return (nav, date) of the all-time high record, or None. Blocking DB I/O."""
+    session = get_sessionmaker()()
+    try:
+        return session.execute(
+            select(CashBalance.nav, CashBalance.date).order_by(CashBalance.nav.desc()).limit(1)
+        ).first()
+    finally:
+        session.close()
+
 @dp.message(Command("max", ignore_case=True))
 async def cmd_max(m: types.Message):
-    if m.from_user.id not in settings.allowed_ids_list: return
-    
-    async with httpx.AsyncClient(timeout=30) as client:
-        try:
-            # 1. Fetch Real-time Summary
-            r = await client.get(f"{settings.WEB_SERVICE_URL}/account/summary", headers=API_HEADERS)
-            r.raise_for_status()
-            realtime_data = r.json()
-            curr_val = float(realtime_data.get('NetLiquidation', 0))
+    try:
+        # 1. Fetch Real-time Summary
+        r = await api_client.get("/account/summary")
+        r.raise_for_status()
+        realtime_data = orjson.loads(r.content)
+        curr_val = float(realtime_data.get('NetLiquidation', 0))
+        
+        # 2. Get Max NAV from DB
+        max_rec = await asyncio.to_thread(_max_nav_sync)
+        if not max_rec:
+            await m.answer("📭 No historical data available in database.")
+            return
+
+        max_val = float(max_rec[0] or 0)
+        
+        # If current real-time NAV is higher than historical max, use current as "new high"
+        if curr_val > max_val:
+            max_val = curr_val
+            max_date_str = "Now (Real-time)"
+        else:
+            max_date_str = max_rec[1].strftime("%Y-%m-%d %H:%M:%S")
+
+        drawdown = ((curr_val - max_val) / max_val * 100) if max_val > 0 else 0
+        
+        msg = (
+            f"🏆 *All Time High*\n"
+            f"💰 NAV: `{max_val:.2f}`\n"
+            f"📅 Date: `{max_date_str}`\n\n"
+            f"⚡️ *Real-time Status*\n"
+            f"💰 NAV: `{curr_val:.2f}`\n"
+            f"📉 Drawdown: `{drawdown:+.2f}%`"
+        )
+        await m.answer(msg, parse_mode="Markdown")
             
-            # 2. Get Max NAV from DB
-            session = SessionLocal()
-            try:
-                max_rec = session.query(CashBalance).order_by(CashBalance.nav.desc()).first()
-                if not max_rec:
-                    await m.answer("📭 No historical data available in database.")
-                    return
-
-                max_val = float(max_rec.nav or 0)
-                
-                # If current real-time NAV is higher than historical max, use current as "new high"
-                if curr_val > max_val:
-                    max_val = curr_val
-                    max_date_str = "Now (Real-time)"
-                else:
-                    max_date_str = max_rec.date.strftime("%Y-%m-%d %H:%M:%S")
-
-                drawdown = ((curr_val - max_val) / max_val * 100) if max_val > 0 else 0
-                
-                msg = (
-                    f"🏆 *All Time High*\n"
-                    f"💰 NAV: `{max_val:.2f}`\n"
-                    f"📅 Date: `{max_date_str}`\n\n"
-                    f"⚡️ *Real-time Status*\n"
-                    f"💰 NAV: `{curr_val:.2f}`\n"
-                    f"📉 Drawdown: `{drawdown:+.2f}%`"
-                )
-                await m.answer(msg, parse_mode="Markdown")
-            finally:
-                session.close()
-                
-        except httpx.HTTPStatusError as e:
-            err_detail = e.response.text or str(e)
-            logger.error(f"HTTP Error in /max: {err_detail}")
-            await m.answer(f"❌ API Error: {err_detail}")
-        except Exception as e:
-            logger.error(f"Error in /max: {e}", exc_info=True)
-            msg = str(e) or repr(e)
-            await m.answer(f"❌ Error: {msg}")
+    except httpx.HTTPStatusError as e:
+        err_detail = e.response.text or str(e)
+        logger.error(f"HTTP Error in /max: {err_detail}")
+        await m.answer(f"❌ API Error: {err_detail}")
+    except Exception as e:
+        logger.error(f"Error in /max: {e}", exc_info=True)
+        msg = str(e) or repr(e)
+        await m.answer(f"❌ Error: {msg}")
+
+def _today_range_sync(today_start: datetime):
+    """Return ((nav, date) of today's min, (nav, date) of today's max), or (None, None). Blocking DB I/O."""
+    session = get_sessionmaker()()
+    try:
+        # Get records for min and max today
+        min_rec = session.query(CashBalance).filter(CashBalance.date >= today_start).order_by(CashBalance.nav.asc()).first()
+        max_rec = session.query(CashBalance).filter(CashBalance.date >= today_start).order_by(CashBalance.nav.desc()).first()
+        if not min_rec:
+            return None, None
+        return (min_rec.nav, min_rec.date), (max_rec.nav, max_rec.date)
+    finally:
+        session.close()
 
 @dp.message(Command("today", ignore_case=True))
 async def cmd_today(m: types.Message):
-    if m.from_user.id not in settings.allowed_ids_list: return
-    
-    async with httpx.AsyncClient(timeout=30) as client:
-        try:
-            # 1. Fetch Real-time Summary
-            r = await client.get(f"{settings.WEB_SERVICE_URL}/account/summary", headers=API_HEADERS)
-            r.raise_for_status()
-            realtime_data = r.json()
-            curr_val = float(realtime_data.get('NetLiquidation', 0))
-            
-            # 2. Query today's min/max from DB
-            session = SessionLocal()
-            try:
-                today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-                
-                # Get records for min and max today
-                min_rec = session.query(CashBalance).filter(CashBalance.date >= today_start).order_by(CashBalance.nav.asc()).first()
-                max_rec = session.query(CashBalance).filter(CashBalance.date >= today_start).order_by(CashBalance.nav.desc()).first()
-                
-                if not min_rec:
-                    msg = (
-                        f"📅 *Daily NAV Range*\n"
-                        f"📭 No records found in the database for today.\n"
-                        f"💰 Current: `{curr_val:.2f}`"
-                    )
-                    await m.answer(msg, parse_mode="Markdown")
-                    return
+    try:
+        # 1. Fetch Real-time Summary
+        r = await api_client.get("/account/summary")
+        r.raise_for_status()
+        realtime_data = orjson.loads(r.content)
+        curr_val = float(realtime_data.get('NetLiquidation', 0))
+        
+        # 2. Query today's min/max from DB
+        today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        min_rec, max_rec = await asyncio.to_thread(_today_range_sync, today_start)
+        
+        if not min_rec:
+            msg = (
+                f"📅 *Daily NAV Range*\n"
+                f"📭 No records found in the database for today.\n"
+                f"💰 Current: `{curr_val:.2f}`"
+            )
+            await m.answer(msg, parse_mode="Markdown")
+            return
 
-                min_val = float(min_rec.nav)
-                min_time = min_rec.date.strftime("%H:%M")
-                
-                max_val = float(max_rec.nav)
-                max_time = max_rec.date.strftime("%H:%M")
-                
-                # Adjust with current value if it's more extreme than what's in DB today
-                if curr_val < min_val:
-                    min_val = curr_val
-                    min_time = f"{datetime.now().strftime('%H:%M')} (Now)"
-                if curr_val > max_val:
-                    max_val = curr_val
-                    max_time = f"{datetime.now().strftime('%H:%M')} (Now)"
-                
-                msg = (
-                    f"📅 *Daily NAV Range*\n"
-                    f"🔹 Min: `{min_val:.2f}` (at {min_time})\n"
-                    f"🔸 Max: `{max_val:.2f}` (at {max_time})\n"
-                    f"💰 Current: `{curr_val:.2f}`"
-                )
-                await m.answer(msg, parse_mode="Markdown")
-            finally:
-                session.close()
-                
-        except Exception as e:
-            logger.error(f"Error in cmd_today: {e}")
-            msg = str(e) or repr(e)
-            await m.answer(f"❌ Error: {msg}")
+        min_val = float(min_rec[0])
+        min_time = min_rec[1].strftime("%H:%M")
+        
+        max_val = float(max_rec[0])
+        max_time = max_rec[1].strftime("%H:%M")
+        
+        # Adjust with current value if it's more extreme than what's in DB today
+        if curr_val < min_val:
+            min_val = curr_val
+            min_time = f"{datetime.now().strftime('%H:%M')} (Now)"
+        if curr_val > max_val:
+            max_val = curr_val
+            max_time = f"{datetime.now().strftime('%H:%M')} (Now)"
+        
+        msg = (
+            f"📅 *Daily NAV Range*\n"
+            f"🔹 Min: `{min_val:.2f}` (at {min_time})\n"
+            f"🔸 Max: `{max_val:.2f}` (at {max_time})\n"
+            f"💰 Current: `{curr_val:.2f}`"
+        )
+        await m.answer(msg, parse_mode="Markdown")
+            
+    except Exception as e:
+        logger.error(f"Error in cmd_today: {e}")
+        msg = str(e) or repr(e)
+        await m.answer(f"❌ Error: {msg}")
 
 @dp.message(Command("help", ignore_case=True))
 async def cmd_help(m: types.Message):
-    if m.from_user.id not in settings.allowed_ids_list: return
-    
     help_text = (
         "🤖 *IBKR Bot Commands:*\n\n"
         "💰 /nav - Show current NAV and Cushion\n"
@@ -498,66 +660,58 @@ async def cmd_help(m: types.Message):
 
 @dp.message(Command("orders", ignore_case=True))
 async def cmd_orders(m: types.Message):
-    if m.from_user.id not in settings.allowed_ids_list: return
-    
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        try:
-            r = await client.get(f"{settings.WEB_SERVICE_URL}/account/orders", headers=API_HEADERS)
-            r.raise_for_status()
-            orders = r.json()
-            
-            if not orders:
-                await m.answer("📭 No active orders.")
-                return
+    try:
+        r = await api_client.get("/account/orders")
+        r.raise_for_status()
+        orders = orjson.loads(r.content)
+        
+        if not orders:
+            await m.answer("📭 No active orders.")
+            return
 
-            msg = "📋 *Active Orders*:\n"
-            for o in orders[:15]: # Limit to 15
-                msg += f"• `{o['action']} {o['totalQuantity']} {o['symbol']} @ {o['lmtPrice'] or 'MKT'}` ({o['status']})\n"
-            
-            await m.answer(msg, parse_mode="Markdown")
-        except httpx.HTTPStatusError as e:
-            err_detail = e.response.text or str(e)
-            logger.error(f"HTTP Error in /orders: {err_detail}")
-            await m.answer(f"❌ API Error: {err_detail}")
-        except Exception as e:
-            logger.error(f"Error in /orders: {e}", exc_info=True)
-            msg = str(e) or repr(e)
-            await m.answer(f"❌ Error: {msg}")
+        msg = "📋 *Active Orders*:\n"
+        for o in orders[:15]: # Limit to 15
+            msg += f"• `{o['action']} {o['totalQuantity']} {o['symbol']} @ {o['lmtPrice'] or 'MKT'}` ({o['status']})\n"
+        
+        await m.answer(msg, parse_mode="Markdown")
+    except httpx.HTTPStatusError as e:
+        err_detail = e.response.text or str(e)
+        logger.error(f"HTTP Error in /orders: {err_detail}")
+        await m.answer(f"❌ API Error: {err_detail}")
+    except Exception as e:
+        logger.error(f"Error in /orders: {e}", exc_info=True)
+        msg = str(e) or repr(e)
+        await m.answer(f"❌ Error: {msg}")
 
 @dp.message(Command("trades", ignore_case=True))
 async def cmd_trades(m: types.Message):
-    if m.from_user.id not in settings.allowed_ids_list: return
-    
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        try:
-            r = await client.get(f"{settings.WEB_SERVICE_URL}/account/trades", headers=API_HEADERS)
-            r.raise_for_status()
-            trades = r.json()
-            
-            if not trades:
-                await m.answer("📭 No trades executed today.")
-                return
+    try:
+        r = await api_client.get("/account/trades")
+        r.raise_for_status()
+        trades = orjson.loads(r.content)
+        
+        if not trades:
+            await m.answer("📭 No trades executed today.")
+            return
 
-            msg = "🤝 *Recent Trades*:\n"
-            for t in trades[:15]:
-                # 2025-12-30T10:00:00 -> 10:00:00
-                time_str = t['time'].split('T')[1].split('.')[0] if 'T' in t['time'] else t['time']
-                msg += f"• `{time_str}`: {t['side']} `{t['shares']}` *{t['symbol']}* @ `{t['price']}`\n"
-            
-            await m.answer(msg, parse_mode="Markdown")
-        except httpx.HTTPStatusError as e:
-            err_detail = e.response.text or str(e)
-            logger.error(f"HTTP Error in /trades: {err_detail}")
-            await m.answer(f"❌ API Error: {err_detail}")
-        except Exception as e:
-            logger.error(f"Error in /trades: {e}", exc_info=True)
-            msg = str(e) or repr(e)
-            await m.answer(f"❌ Error: {msg}")
+        msg = "🤝 *Recent Trades*:\n"
+        for t in trades[:15]:
+            # 2025-12-30T10:00:00 -> 10:00:00
+            time_str = t['time'].split('T')[1].split('.')[0] if 'T' in t['time'] else t['time']
+            msg += f"• `{time_str}`: {t['side']} `{t['shares']}` *{t['symbol']}* @ `{t['price']}`\n"
+        
+        await m.answer(msg, parse_mode="Markdown")
+    except httpx.HTTPStatusError as e:
+        err_detail = e.response.text or str(e)
+        logger.error(f"HTTP Error in /trades: {err_detail}")
+        await m.answer(f"❌ API Error: {err_detail}")
+    except Exception as e:
+        logger.error(f"Error in /trades: {e}", exc_info=True)
+        msg = str(e) or repr(e)
+        await m.answer(f"❌ Error: {msg}")
 
 @dp.message(Command("quote", ignore_case=True))
 async def cmd_quote(m: types.Message):
-    if m.from_user.id not in settings.allowed_ids_list: return
-    
     args = m.text.split()
     if len(args) < 2:
         await m.answer("ℹ️ Usage: `/quote <SYMBOL>` (e.g. `/quote SPY`)", parse_mode="Markdown")
@@ -567,47 +721,44 @@ async def cmd_quote(m: types.Message):
     
     msg = await m.answer(f"🔍 Getting quote for {symbol}...")
     
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        try:
-            r = await client.get(f"{settings.WEB_SERVICE_URL}/market/snapshot/{symbol}", headers=API_HEADERS)
-            r.raise_for_status()
-            data = r.json()
-            
-            # Format output
-            # Symbol: SPY
-            # Price: 420.50
-            # Bid/Ask: 420.40 / 420.60
-            
-            out = f"📈 *Quote: {data['symbol']}*\n\n"
-            out += f"💰 Price: `{data['price']:.2f}`\n"
-            if data.get('bid') and data.get('ask'):
-                out += f"↔️ Bid/Ask: `{data['bid']:.2f} / {data['ask']:.2f}`\n"
-            
-            # Format timestamp: 2025-12-30T16:26:52.882122Z -> 2025-12-30 16:26:52
-            ts_str = data['timestamp']
-            if 'T' in ts_str:
-                date_part, time_part = ts_str.split('T')
-                time_part = time_part.split('.')[0].replace('Z', '')
-                ts_formatted = f"{date_part} {time_part}"
-            else:
-                ts_formatted = ts_str
-                
-            out += f"⏱ `{ts_formatted}`"
+    try:
+        r = await api_client.get(f"/market/snapshot/{symbol}")
+        r.raise_for_status()
+        data = orjson.loads(r.content)
+        
+        # Format output
+        # Symbol: SPY
+        # Price: 420.50
+        # Bid/Ask: 420.40 / 420.60
+        
+        out = f"📈 *Quote: {data['symbol']}*\n\n"
+        out += f"💰 Price: `{data['price']:.2f}`\n"
+        if data.get('bid') and data.get('ask'):
+            out += f"↔️ Bid/Ask: `{data['bid']:.2f} / {data['ask']:.2f}`\n"
+        
+        # Format timestamp: 2025-12-30T16:26:52.882122Z -> 2025-12-30 16:26:52
+        ts_str = data['timestamp']
+        if 'T' in ts_str:
+            date_part, time_part = ts_str.split('T')
+            time_part = time_part.split('.')[0].replace('Z', '')
+            ts_formatted = f"{date_part} {time_part}"
+        else:
+            ts_formatted = ts_str
             
-            await msg.edit_text(out, parse_mode="Markdown")
-        except httpx.HTTPStatusError as e:
-            err_detail = e.response.text or str(e)
-            logger.error(f"HTTP Error in /quote: {err_detail}")
-            await msg.edit_text(f"❌ API Error: {err_detail}")
-        except Exception as e:
-            logger.error(f"Error in /quote: {e}", exc_info=True)
-            txt = str(e) or repr(e)
-            await msg.edit_text(f"❌ Error: {txt}")
+        out += f"⏱ `{ts_formatted}`"
+        
+        await msg.edit_text(out, parse_mode="Markdown")
+    except httpx.HTTPStatusError as e:
+        err_detail = e.response.text or str(e)
+        logger.error(f"HTTP Error in /quote: {err_detail}")
+        await msg.edit_text(f"❌ API Error: {err_detail}")
+    except Exception as e:
+        logger.error(f"Error in /quote: {e}", exc_info=True)
+        txt = str(e) or repr(e)
+        await msg.edit_text(f"❌ Error: {txt}")
 
 @dp.message(Command("contract", ignore_case=True))
 async def cmd_contract(m: types.Message):
-    if m.from_user.id not in settings.allowed_ids_list: return
-    
     args = m.text.split()
     if len(args) < 2:
         await m.answer("ℹ️ Usage: `/contract <SYMBOL>`", parse_mode="Markdown")
@@ -615,40 +766,37 @@ async def cmd_contract(m: types.Message):
     
     symbol = args[1].upper()
     
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        try:
-            r = await client.get(f"{settings.WEB_SERVICE_URL}/contract/search?symbol={symbol}", headers=API_HEADERS)
-            r.raise_for_status()
-            details = r.json()
-            
-            if not details:
-                await m.answer(f"❌ No contract found for {symbol}.")
-                return
+    try:
+        r = await api_client.get(f"/contract/search?symbol={symbol}")
+        r.raise_for_status()
+        details = orjson.loads(r.content)
+        
+        if not details:
+            await m.answer(f"❌ No contract found for {symbol}.")
+            return
 
-            out = f"📄 *Contract Details ({len(details)})*:\n\n"
-            for d in details[:3]: # Limit to 3 detailed views
-                out += f"🔹 *{d['symbol']}* ({d['secType']})\n"
-                out += f"   • Name: {d['longName']}\n"
-                out += f"   • ID: `{d['conId']}` | Exch: {d['exchange']}\n"
-                if d.get('isin'):
-                    out += f"   • ISIN: `{d['isin']}`\n"
-                out += "\n"
+        out = f"📄 *Contract Details ({len(details)})*:\n\n"
+        for d in details[:3]: # Limit to 3 detailed views
+            out += f"🔹 *{d['symbol']}* ({d['secType']})\n"
+            out += f"   • Name: {d['longName']}\n"
+            out += f"   • ID: `{d['conId']}` | Exch: {d['exchange']}\n"
+            if d.get('isin'):
+                out += f"   • ISIN: `{d['isin']}`\n"
+            out += "\n"
 
-            
-            await m.answer(out, parse_mode="Markdown")
-        except httpx.HTTPStatusError as e:
-            err_detail = e.response.text or str(e)
-            logger.error(f"HTTP Error in /contract: {err_detail}")
-            await m.answer(f"❌ API Error: {err_detail}")
-        except Exception as e:
-            logger.error(f"Error in /contract: {e}", exc_info=True)
-            msg = str(e) or repr(e)
-            await m.answer(f"❌ Error: {msg}")
+        
+        await m.answer(out, parse_mode="Markdown")
+    except httpx.HTTPStatusError as e:
+        err_detail = e.response.text or str(e)
+        logger.error(f"HTTP Error in /contract: {err_detail}")
+        await m.answer(f"❌ API Error: {err_detail}")
+    except Exception as e:
+        logger.error(f"Error in /contract: {e}", exc_info=True)
+        msg = str(e) or repr(e)
+        await m.answer(f"❌ Error: {msg}")
 
 @dp.message(Command("chain", ignore_case=True))
 async def cmd_chain(m: types.Message):
-    if m.from_user.id not in settings.allowed_ids_list: return
-    
     args = m.text.split()
     if len(args) < 2:
         await m.answer("ℹ️ Usage: `/chain <SYMBOL>` (e.g. `/chain AAPL`)", parse_mode="Markdown")
@@ -657,182 +805,225 @@ async def cmd_chain(m: types.Message):
     symbol = args[1].upper()
     msg = await m.answer(f"🔍 Fetching option chain for {symbol}...")
     
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        try:
-            r = await client.get(f"{settings.WEB_SERVICE_URL}/options/chain/{symbol}", headers=API_HEADERS)
-            r.raise_for_status()
-            chains = r.json()
-            
-            if not chains:
-                await msg.edit_text(f"❌ No option chain found for {symbol}.")
-                return
+    try:
+        r = await api_client.get(f"/options/chain/{symbol}")
+        r.raise_for_status()
+        chains = orjson.loads(r.content)
+        
+        if not chains:
+            await msg.edit_text(f"❌ No option chain found for {symbol}.")
+            return
 
-            # Use the first chain (usually SMART exchange)
-            chain = chains[0]
-            expirations = chain.get('expirations', [])
-            strikes = chain.get('strikes', [])
-            
-            # Format expiration dates (YYYYMMDD -> YYYY-MM-DD)
-            def fmt_exp(exp):
-                return f"{exp[:4]}-{exp[4:6]}-{exp[6:]}"
-            
-            # Group expirations by month for compact display
-            exp_by_month = {}
-            for exp in expirations[:24]:  # Limit to next 24 expirations
-                month_key = exp[:6]  # YYYYMM
-                if month_key not in exp_by_month:
-                    exp_by_month[month_key] = []
-                exp_by_month[month_key].append(exp[6:])  # Just the day
-            
-            out = f"📊 <b>Option Chain: {symbol}</b>\n"
-            out += f"<code>📅 Exchange: {chain['exchange']} | Mult: {chain['multiplier']}</code>\n\n"
-            
-            out += "<b>Expirations:</b>\n"
-            for month_key in sorted(exp_by_month.keys())[:6]:  # Show 6 months
-                year = month_key[:4]
-                month = month_key[4:6]
-                days = ", ".join(exp_by_month[month_key][:8])  # Limit days per month
-                out += f"<code>{year}-{month}: {days}</code>\n"
-            if len(exp_by_month) > 6:
-                out += f"<code>... +{len(exp_by_month) - 6} more months</code>\n"
-            
-            # Show strike range
-            if strikes:
-                min_strike = min(strikes)
-                max_strike = max(strikes)
-                mid_idx = len(strikes) // 2
-                sample_strikes = strikes[max(0, mid_idx-3):mid_idx+4]
-                out += f"<code>Strikes: {min_strike:.0f} - {max_strike:.0f} ({len(strikes)} total)</code>\n"
-                out += f"<code>Sample: {', '.join(f'{s:.0f}' for s in sample_strikes)}</code>"
-            
-            await msg.edit_text(out, parse_mode="HTML")
-        except httpx.HTTPStatusError as e:
-            err_detail = e.response.text or str(e)
-            logger.error(f"HTTP Error in /chain: {err_detail}")
-            await msg.edit_text(f"❌ API Error: {err_detail}")
-        except Exception as e:
-            logger.error(f"Error in /chain: {e}", exc_info=True)
-            txt = str(e) or repr(e)
-            await msg.edit_text(f"❌ Error: {txt}")
+        # Use the first chain (usually SMART exchange)
+        chain = chains[0]
+        expirations = chain.get('expirations', [])
+        strikes = chain.get('strikes', [])
+        
+        # Group expirations by month for compact display
+        exp_by_month = {}
+        for exp in expirations[:24]:  # Limit to next 24 expirations
+            month_key = exp[:6]  # YYYYMM
+            if month_key not in exp_by_month:
+                exp_by_month[month_key] = []
+            exp_by_month[month_key].append(exp[6:])  # Just the day
+        
+        out = f"📊 <b>Option Chain: {symbol}</b>\n"
+        out += f"<code>📅 Exchange: {chain['exchange']} | Mult: {chain['multiplier']}</code>\n\n"
+        
+        out += "<b>Expirations:</b>\n"
+        for month_key in sorted(exp_by_month.keys())[:6]:  # Show 6 months
+            year = month_key[:4]
+            month = month_key[4:6]
+            days = ", ".join(exp_by_month[month_key][:8])  # Limit days per month
+            out += f"<code>{year}-{month}: {days}</code>\n"
+        if len(exp_by_month) > 6:
+            out += f"<code>... +{len(exp_by_month) - 6} more months</code>\n"
+        
+        # Show strike range
+        if strikes:
+            # The API returns strikes sorted ascending
+            min_strike = strikes[0]
+            max_strike = strikes[-1]
+            mid_idx = len(strikes) // 2
+            sample_strikes = strikes[max(0, mid_idx-3):mid_idx+4]
+            out += f"<code>Strikes: {min_strike:.0f} - {max_strike:.0f} ({len(strikes)} total)</code>\n"
+            out += f"<code>Sample: {', '.join(f'{s:.0f}' for s in sample_strikes)}</code>"
+        
+        await msg.edit_text(out, parse_mode="HTML")
+    except httpx.HTTPStatusError as e:
+        err_detail = e.response.text or str(e)
+        logger.error(f"HTTP Error in /chain: {err_detail}")
+        await msg.edit_text(f"❌ API Error: {err_detail}")
+    except Exception as e:
+        logger.error(f"Error in /chain: {e}", exc_info=True)
+        txt = str(e) or repr(e)
+        await msg.edit_text(f"❌ Error: {txt}")
 
 # Scheduler
 
-scheduler = AsyncIOScheduler()
+# coalesce + max_instances: a delayed or backlogged job fires once, never in parallel with itself
+scheduler = AsyncIOScheduler(job_defaults={'coalesce': True, 'max_instances': 1, 'misfire_grace_time': 300})
+
+def _parse_token_expiry() -> tuple[str, datetime | None]:
+    """Parse IB_FLEX_TOKEN_EXPIRY once; the setting is constant for the process lifetime."""
+    # Expected format: "2026-02-18, 05:34:27 EST"
+    expiry_str = settings.IB_FLEX_TOKEN_EXPIRY.split(',')[0].strip()
+    if not expiry_str:
+        return expiry_str, None
+    try:
+        return expiry_str, datetime.strptime(expiry_str, "%Y-%m-%d")
+    except ValueError as e:
+        logger.error(f"Invalid IB_FLEX_TOKEN_EXPIRY format: {e}")
+        return expiry_str, None
+
+TOKEN_EXPIRY_STR, TOKEN_EXPIRY_DATE = _parse_token_expiry()
+
+# Flex download/parse and SMTP can each block for seconds; a dedicated pool keeps
+# them from tying up the default executor used by the DB helpers.
+flex_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="flex")
+
+async def run_in_flex_executor(fn, /, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(flex_executor, partial(fn, *args, **kwargs))
 
 async def check_token_expiry():
-    if not settings.IB_FLEX_TOKEN_EXPIRY:
+    if TOKEN_EXPIRY_DATE is None:
         return
     
     try:
-        # Expected format: "2026-02-18, 05:34:27 EST"
-        expiry_str = settings.IB_FLEX_TOKEN_EXPIRY.split(',')[0].strip()
-        expiry_date = datetime.strptime(expiry_str, "%Y-%m-%d")
-        days_left = (expiry_date - datetime.now()).days
+        days_left = (TOKEN_EXPIRY_DATE - datetime.now()).days
         
         if 0 <= days_left <= 10:
             await notify_admins(
                 f"⚠️ *IBKR Flex Token Expiry Alert*\n\n"
-                f"Your token will expire in *{days_left} days* (`{expiry_str}`).\n"
+                f"Your token will expire in *{days_left} days* (`{TOKEN_EXPIRY_STR}`).\n"
                 f"Please generate a new one to avoid service interruption."
             )
         elif days_left < 0:
              await notify_admins(
                 f"❌ *IBKR Flex Token EXPIRED*\n\n"
-                f"Your token expired on `{expiry_str}`. Flex reports will fail until a new token is provided."
+                f"Your token expired on `{TOKEN_EXPIRY_STR}`. Flex reports will fail until a new token is provided."
             )
     except Exception as e:
         logger.error(f"Error checking token expiry: {e}")
 
-async def scheduled_flex_report(query_id=None, report_type="Daily", retry_count=0, local_date=None):
-    attempt_str = f" (Attempt {retry_count + 1})" if not local_date else f" (Local: {local_date})"
-    logger.info(f"Running scheduled {report_type} Flex Query Report{attempt_str}...")
-    try:
-        # Run blocking report generation in a thread
-        # Now returns (html, date_range_html, date_range_subject, telegram_msgs, archive_status)
-        html, date_range_html, date_range_subject, telegram_msgs, archive_status = await asyncio.to_thread(
-            FlexReporter.run_report, 
-            query_id=query_id, 
-            local_date=local_date,
-            report_type=report_type
-        )
-        
-        if not date_range_html:
-            logger.warning(f"{report_type} Flex Query failed: {html}") # Log warning instead of error for retries
-            
-            # Retry only if it's a scheduled run (not local)
-            if not local_date:
-                if retry_count < 10:
-                    next_run = datetime.now() + timedelta(hours=1)
-                    scheduler.add_job(
-                        scheduled_flex_report, 
-                        'date', 
-                        run_date=next_run, 
-                        args=[query_id, report_type, retry_count + 1]
-                    )
-                    logger.info(f"Rescheduled {report_type} Flex Report retry #{retry_count + 1} for {next_run}")
-                    return
-                else:
-                    logger.error(f"{report_type} Flex Query failed after 10 retries: {html}")
-                    await notify_admins(f"⚠️ {report_type} Flex Query Report Error (Failed after 10 attempts): {html}")
-                    return
-            else:
-                await notify_admins(f"❌ Local {report_type} Flex Query Error: {html}")
-                return
+# Flex retries: exponential backoff from 30 s, capped at 1 h, plus jitter
+FLEX_MAX_RETRIES = 10
+FLEX_RETRY_BASE_DELAY = 30
+FLEX_RETRY_MAX_DELAY = 3600
+FLEX_RETRY_JITTER = 15
 
-        # Run blocking email sending in a thread
-        project_prefix = settings.PROJECT_ID.upper()
-        if report_type == "Monthly":
-            subject = f"{project_prefix} - IB Flex Query {date_range_subject}"
-        else:
-            subject = f"{project_prefix} - IB {report_type} Flex Query {date_range_html}"
+class FlexReportError(Exception):
+    """The Flex Query returned no statement (e.g. not generated yet)."""
 
-        if local_date:
-            subject += " (Local Re-run)"
+async def _run_flex_report(query_id, report_type, local_date):
+    # Run blocking report generation in the Flex worker pool
+    # Now returns (html, date_range_html, date_range_subject, telegram_msgs, archive_status)
+    html, date_range_html, date_range_subject, telegram_msgs, archive_status = await run_in_flex_executor(
+        FlexReporter.run_report, 
+        query_id=query_id, 
+        local_date=local_date,
+        report_type=report_type
+    )
+    
+    if not date_range_html:
+        raise FlexReportError(html)
 
-        email_status = await asyncio.to_thread(FlexReporter.send_email, html, subject)
-        
-        # Send Telegram Messages (Summary + Dividends etc)
-        # Ensure date is shown first as requested
-        await notify_admins(f"📅 *{report_type} Flex Query Date*: `{date_range_html}`")
+    # Run blocking email sending in the Flex worker pool
+    project_prefix = settings.PROJECT_ID.upper()
+    if report_type == "Monthly":
+        subject = f"{project_prefix} - IB Flex Query {date_range_subject}"
+    else:
+        subject = f"{project_prefix} - IB {report_type} Flex Query {date_range_html}"
 
-        for msg in telegram_msgs:
-            if msg.strip():
-                # Split message into lines and wrap each in code
-                lines = msg.strip().split('\n')
-                formatted_msg = '\n'.join(f'<code>{line}</code>' for line in lines if line.strip())
-                await notify_admins(formatted_msg, parse_mode="HTML")
-        
-        # Send simple completion status with Archiving info
-        await notify_admins(
-            f"📊 *{report_type} Report Generated*\nDate: {date_range_html}\nArchived: {archive_status}\nEmail: {email_status}"
-        )
-    except Exception as e:
-        logger.error(f"{report_type} Scheduler/Report Error: {e}")
-        if not local_date:
-            if retry_count < 10:
-                next_run = datetime.now() + timedelta(hours=1)
-                scheduler.add_job(
-                    scheduled_flex_report, 
-                    'date', 
-                    run_date=next_run, 
-                    args=[query_id, report_type, retry_count + 1]
-                )
-                logger.info(f"Rescheduled {report_type} Flex Report retry #{retry_count + 1} (due to error) for {next_run}")
+    if local_date:
+        subject += " (Local Re-run)"
+
+    email_status = await run_in_flex_executor(FlexReporter.send_email, html, subject)
+    
+    # Send Telegram Messages (Summary + Dividends etc)
+    # Ensure date is shown first as requested
+    await notify_admins(f"📅 *{report_type} Flex Query Date*: `{date_range_html}`")
+
+    for msg in telegram_msgs:
+        if msg.strip():
+            # Split message into lines and wrap each in code
+            lines = msg.strip().split('\n')
+            formatted_msg = '\n'.join(f'<code>{line}</code>' for line in lines if line.strip())
+            await notify_admins(formatted_msg, parse_mode="HTML")
+    
+    # Send simple completion status with Archiving info
+    await notify_admins(
+        f"📊 *{report_type} Report Generated*\nDate: {date_range_html}\nArchived: {archive_status}\nEmail: {email_status}"
+    )
+
+# Errors worth another attempt: run_report reports download/parse failures
+# (including a statement not generated yet) as a result without a date range,
+# raised as FlexReportError; send_email reports its failures in the status text
+FLEX_RETRYABLE = (FlexReportError,)
+
+async def scheduled_flex_report(query_id=None, report_type="Daily", local_date=None):
+    # Retry only if it's a scheduled run (not local)
+    max_retries = 0 if local_date else FLEX_MAX_RETRIES
+    
+    for retry_count in range(max_retries + 1):
+        attempt_str = f" (Attempt {retry_count + 1})" if not local_date else f" (Local: {local_date})"
+        logger.info(f"Running scheduled {report_type} Flex Query Report{attempt_str}...")
+        try:
+            await _run_flex_report(query_id, report_type, local_date)
+            return
+        except FLEX_RETRYABLE as e:
+            logger.warning(f"{report_type} Flex Query failed: {e}") # Log warning instead of error for retries
+            if local_date:
+                await notify_admins(f"❌ Local {report_type} Flex Query Error: {e}")
+                return
+            final_msg = f"⚠️ {report_type} Flex Query Report Error (Failed after {FLEX_MAX_RETRIES + 1} attempts): {e}"
+        except Exception as e:
+            # Not transient: retrying would only repeat the failure
+            logger.error(f"{report_type} Scheduler/Report Error: {e}")
+            if local_date:
+                await notify_admins(f"❌ Local {report_type} Flex Query Exception: {e}")
             else:
-                 await notify_admins(f"⚠️ {report_type} Flex Query System Error (Failed after 10 attempts): {e}")
-        else:
-             await notify_admins(f"❌ Local {report_type} Flex Query Exception: {e}")
+                await notify_admins(f"⚠️ {report_type} Flex Query System Error: {e}")
+            return
+        
+        if retry_count < max_retries:
+            delay = min(FLEX_RETRY_MAX_DELAY, FLEX_RETRY_BASE_DELAY * 2 ** retry_count)
+            delay += random.uniform(0, FLEX_RETRY_JITTER)
+            logger.info(f"Retrying {report_type} Flex Report (retry #{retry_count + 1}) in {delay:.0f}s")
+            await asyncio.sleep(delay)
+    
+    logger.error(f"{report_type} Flex Query failed after {FLEX_MAX_RETRIES + 1} attempts")
+    await notify_admins(final_msg)
+
+# Flex report runs in flight (including their backoff sleeps), keyed by
+# (query_id, report_type, local_date) so the same report is never run twice at once
+_flex_tasks: dict[tuple, asyncio.Task] = {}
+
+async def start_flex_report(query_id=None, report_type="Daily", local_date=None) -> bool:
+    """
+    Run scheduled_flex_report as a tracked background task, so neither the
+    /flex handler nor the scheduler job waits out the retry backoff.
+    Returns False if the same report is already running.
+    """
+    key = (query_id, report_type, local_date)
+    if key in _flex_tasks:
+        return False
+    task = asyncio.create_task(scheduled_flex_report(query_id, report_type, local_date))
+    _flex_tasks[key] = task
+    task.add_done_callback(lambda _: _flex_tasks.pop(key, None))
+    return True
 
 @dp.message(Command("flex", ignore_case=True))
 async def cmd_flex(m: types.Message):
-    if m.from_user.id not in settings.allowed_ids_list: return
-    
     args = m.text.split()
     if len(args) > 1:
         arg = args[1].lower().strip()
         if arg == "monthly":
-            await m.answer("Generating Monthly Flex Query Report... ⏳")
-            await scheduled_flex_report(query_id=settings.IB_FLEX_MONTHLY_QUERY_ID, report_type="Monthly")
+            if await start_flex_report(query_id=settings.IB_FLEX_MONTHLY_QUERY_ID, report_type="Monthly"):
+                await m.answer("Generating Monthly Flex Query Report... ⏳")
+            else:
+                await m.answer("Monthly Flex Query Report is already running ⏳")
             return
             
         local_date = arg
@@ -840,11 +1031,30 @@ async def cmd_flex(m: types.Message):
         if not (len(local_date) == 8 and local_date.isdigit()):
              await m.answer("❌ Invalid format. Use /flex YYYYMMDD (e.g. /flex 20251229) or /flex monthly")
              return
-        await m.answer(f"Processing local report for {local_date}.xml ... ⏳")
-        await scheduled_flex_report(local_date=local_date)
+        if await start_flex_report(local_date=local_date):
+            await m.answer(f"Processing local report for {local_date}.xml ... ⏳")
+        else:
+            await m.answer(f"Local report for {local_date}.xml is already being processed ⏳")
     else:
-        await m.answer("Generating Daily Flex Query Report... ⏳")
-        await scheduled_flex_report(query_id=settings.IB_FLEX_DAILY_QUERY_ID, report_type="Daily")
+        if await start_flex_report(query_id=settings.IB_FLEX_DAILY_QUERY_ID, report_type="Daily"):
+            await m.answer("Generating Daily Flex Query Report... ⏳")
+        else:
+            await m.answer("Daily Flex Query Report is already running ⏳")
+
+@dp.shutdown()
+async def on_shutdown():
+    # Pending Flex retries are abandoned rather than rescheduled: the scheduler
+    # uses the in-memory job store, so a 'date' job would not survive the restart
+    for (query_id, report_type, local_date), task in list(_flex_tasks.items()):
+        task.cancel()
+        label = f"Local {report_type} ({local_date})" if local_date else report_type
+        await notify_admins(f"⚠️ {label} Flex Query Report interrupted by shutdown; run /flex to retry")
+    await api_client.aclose()
+    flex_executor.shutdown(wait=False, cancel_futures=True)
+
+def _cron_minutes(interval_min: int) -> frozenset[int]:
+    """Minutes of the hour at which a job with this interval fires (minute 0 for >= 1 hour)."""
+    return frozenset(range(0, 60, interval_min)) if interval_min < 60 else frozenset({0})
 
 async def main():
     # 1. Schedule: Tue,Wed,Thu,Fri,Sat for Flex Query Reports
@@ -857,7 +1067,7 @@ async def main():
 
     # Daily Flex Query: Tue,Wed,Thu,Fri,Sat
     scheduler.add_job(
-        scheduled_flex_report, 
+        start_flex_report, 
         'cron', 
         day_of_week='tue,wed,thu,fri,sat', 
         hour=sh, 
@@ -867,7 +1077,7 @@ async def main():
     
     # Monthly Flex Query: 1st of each month at 12:00
     scheduler.add_job(
-        scheduled_flex_report,
+        start_flex_report,
         'cron',
         day='1',
         hour=12,
@@ -884,7 +1094,7 @@ async def main():
 
     # 3. Schedule: Periodic DB snapshots (Fixed time, e.g. :00, :30)
     # We want these to happen EXACTLY at the interval marks
-    snap_mins = set(range(0, 60, db_insert_interval_min)) if db_insert_interval_min < 60 else {0}
+    snap_mins = _cron_minutes(db_insert_interval_min)
     snap_cron = ",".join(map(str, sorted(snap_mins)))
 
     scheduler.add_job(
@@ -900,7 +1110,7 @@ async def main():
 
     # 4. Schedule: Cash change detection
     # Run at check intervals BUT skip minutes where a snapshot (forced insert) creates a redundancy
-    check_mins = set(range(0, 60, check_interval_min)) if check_interval_min < 60 else {0}
+    check_mins = _cron_minutes(check_interval_min)
     effective_check_mins = check_mins - snap_mins
     
     if effective_check_mins:
@@ -917,6 +1127,8 @@ async def main():
     
     logger.info(f"Scheduler configured: Snapshots at mins={snap_cron}, Checks at mins={check_cron if effective_check_mins else 'None'}")
     
+    await asyncio.to_thread(init_db)
+    await asyncio.to_thread(_load_last_record)
     scheduler.start()
     
     # Initial checks (no forced DB inserts on startup to respect intervals)
@@ -1,3 +1,4 @@
+from functools import cached_property
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
@@ -7,6 +8,7 @@ class Settings(BaseSettings):
     # IBKR Connection (Required by API, optional for Bot)
     IB_PORT: int = 4003
     IB_CLIENT_ID: int = 1
+    IB_MAX_CONCURRENCY: int = 30  # Max concurrent requests sent to the Gateway
     
     @property
     def IB_HOST(self) -> str:
@@ -26,7 +28,7 @@ class Settings(BaseSettings):
     def WEB_SERVICE_URL(self) -> str:
         return f"http://{self.PROJECT_ID}-api:8000"
     
-    @property
+    @cached_property
     def allowed_ids_list(self) -> list[int]:
         if not self.TELEGRAM_ALLOWED_IDS:
             return []
@@ -34,6 +36,11 @@ class Settings(BaseSettings):
             return [int(x.strip()) for x in self.TELEGRAM_ALLOWED_IDS.split(",") if x.strip()]
         except ValueError:
             return []
+
+    @cached_property
+    def allowed_ids_set(self) -> frozenset[int]:
+        # Hashed lookup for the per-update authorization check
+        return frozenset(self.allowed_ids_list)
     CASH_DIFFERENCE_CHECK_INTERVAL: int = 300
     DB_INSERT_INTERVAL: int = 1800
 
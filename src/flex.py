@@ -1,37 +1,81 @@
 # flex.py
 import os
-import sys
 import smtplib
 import xml.etree.ElementTree as ET
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from io import StringIO
+from io import BytesIO
 from ibflex import client as ibflex_client
 from src.config import settings
 
-def sortchildrenby(parent, attr_1, attr_2=None):
+# Seconds before a stalled SMTP connect/command is abandoned
+SMTP_TIMEOUT = 30
+
+# Table row openers, newline-terminated like every other line of the report
+TR_EVEN = '<tr class="even">\n'
+TR_ODD = '<tr class="odd">\n'
+TR_RED = '<tr class="red">\n'
+TR_GREEN = '<tr class="green">\n'
+
+# Escapes free-text Flex fields (descriptions) for HTML in one C-level pass
+_HTML_TRANS = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;'})
+
+def h(text):
+    return text.translate(_HTML_TRANS) if text else ''
+
+def sortchildrenby(seq, attr_1, attr_2=None):
+    # In-place sort of a Python list of elements; the XML tree itself is never reordered
     if attr_2 is None:
-        parent[:] = sorted(parent, key=lambda child: child.get(attr_1) or " ")
+        seq.sort(key=lambda child: child.get(attr_1) or " ")
     else:
-        parent[:] = sorted(parent, key=lambda child: (child.get(attr_1) or " ", child.get(attr_2) or " "))
+        seq.sort(key=lambda child: (child.get(attr_1) or " ", child.get(attr_2) or " "))
+
+# Bound str.format per precision used in the report; '{:.Nf}' already rounds
+_FMTS = {p: ('{:.' + str(p) + 'f}').format for p in (0, 2, 3, 4, 5, 7, 8, 10)}
 
 def fmt_num(val, precision=2):
+    if val is None or val == "":
+        return val
     try:
-        f = float(val)
+        fmt = _FMTS.get(precision) or ('{:.' + str(precision) + 'f}').format
         # Spanish numbering system uses comma as decimal separator
-        return ('{:.' + str(precision) + 'f}').format(round(f, precision)).replace('.', ',')
-    except:
+        return fmt(float(val)).replace('.', ',')
+    except (ValueError, TypeError):
         return val
 
+# Elements read by run_report, collected in one walk over the statement
+REPORT_TAGS = (
+    'FlexStatement', 'CashReportCurrency', 'CashTransaction', 'TransactionTax',
+    'ChangeInDividendAccrual', 'OpenDividendAccrual', 'TierInterestDetail',
+    'Trade', 'ConversionRate',
+)
+
+def collect_elements(source):
+    """
+    Stream-parse a Flex XML document and group the attributes of the REPORT_TAGS
+    elements by tag, in document order. Each element is cleared once read, which
+    drops its attributes and children; the emptied elements themselves stay
+    attached to their parents until the parse finishes.
+    """
+    if isinstance(source, str):
+        source = source.encode('utf-8')
+    buckets = {tag: [] for tag in REPORT_TAGS}
+    get = buckets.get
+    for _, elem in ET.iterparse(BytesIO(source), events=('end',)):
+        bucket = get(elem.tag)
+        if bucket is not None:
+            bucket.append(dict(elem.attrib))
+        elem.clear()
+    return buckets
+
 class FlexReporter:
     @staticmethod
     def run_report(token=None, query_id=None, local_date=None, report_type="Daily"):
         token = token or settings.IB_FLEX_TOKEN
         query_id = query_id or settings.IB_FLEX_DAILY_QUERY_ID
         
-        old_stdout = sys.stdout
-        result = StringIO()
-        sys.stdout = result
+        out = []
+        w = out.append
 
         telegram_msgs = []
         dividend_msg = ""
@@ -46,24 +90,24 @@ class FlexReporter:
                     file_path = os.path.join(dirname, f'../flex_queries/{local_date}.xml')
                     with open(file_path, 'rb') as f:
                         response = f.read()
-                    print(f"<!-- Loaded local report: {local_date}.xml -->")
+                    w(f"<!-- Loaded local report: {local_date}.xml -->\n")
                     
                     try:
-                        tree = ET.ElementTree(ET.fromstring(response))
-                        root = tree.getroot()
+                        elements = collect_elements(response)
                     except Exception as e:
-                         return f"Error parsing local XML: {e}", None, [], None
+                         return f"Error parsing local XML: {e}", None, None, [], None
                          
                 except Exception as e:
-                    return f"Error reading local file {local_date}.xml: {e}", None, [], None
+                    return f"Error reading local file {local_date}.xml: {e}", None, None, [], None
             else:
                 try:
                     response = ibflex_client.download(token, query_id)
-                    tree = ET.ElementTree(ET.fromstring(response))
-                    root = tree.getroot()
+                    elements = collect_elements(response)
                 except Exception as e:
                     return f"Error downloading/parsing Flex Query: {e}", None, None, [], None
 
+            flex_stmt = elements['FlexStatement'][0] if elements['FlexStatement'] else None
+
             # 2. Archiving (Only if not local)
             archive_status = "Skipped (Local)"
             if not local_date:
@@ -71,7 +115,6 @@ class FlexReporter:
                     archive_dir = '/app/flex_queries'
                     os.makedirs(archive_dir, exist_ok=True)
                     
-                    flex_stmt = root.find('.//FlexStatement')
                     f_date = flex_stmt.get('fromDate')
                     # t_date = flex_stmt.get('toDate')
                     # User requested YYYYMMDD.xml format, add -monthly suffix if applicable
@@ -84,15 +127,15 @@ class FlexReporter:
                     archive_status = f"Saved: {arch_filename}"
                 except Exception as e:
                     archive_status = f"Failed: {e}"
-                    print(f"<!-- Archiving failed: {e} -->")
+                    w(f"<!-- Archiving failed: {e} -->\n")
             else:
                 archive_status = f"Read from: {local_date}.xml"
 
             # 3. Report Logic
             
             # Date range
-            fromDate = root.find('.//FlexStatement').get('fromDate')
-            toDate = root.find('.//FlexStatement').get('toDate')
+            fromDate = flex_stmt.get('fromDate')
+            toDate = flex_stmt.get('toDate')
             
             # Format for HTML (with hyphens)
             dateRangeHTML = fromDate + ' to ' + toDate if fromDate != toDate else fromDate
@@ -102,106 +145,113 @@ class FlexReporter:
             t_clean = toDate.replace('-', '')
             dateRangeSubject = f_clean + ' to ' + t_clean if f_clean != t_clean else f_clean
             
-            print('<h1>' + dateRangeHTML + ': Cash Transactions Report</h1>')
+            w('<h1>' + dateRangeHTML + ': Cash Transactions Report</h1>\n')
 
             # CashReport
             summary_msg = "Flex Query Report\n" + "-" * 12 + "\n"
-            print('<h2>Cash Report</h2>')
-            print('<table> <thead> <tr>')
-            print('<td>cur</td> <td>startCash</td> <td>endCash</td> <td>endSettledCash</td> <td>deposits</td> '
-                  '<td>w/drawals</td> <td>purchases</td> <td>sales</td> <td>divs</td> <td>inLieu</td> <td>whTax</td> '
-                  '<td>brkrInt.</td> <td>commiss.</td> <td>transTax</td> <td>fxGainLoss</td></tr> </thead> <tbody>')
+            w('<h2>Cash Report</h2>\n')
+            w('<table> <thead> <tr>\n')
+            w('<td>cur</td> <td>startCash</td> <td>endCash</td> <td>endSettledCash</td> <td>deposits</td> '
+              '<td>w/drawals</td> <td>purchases</td> <td>sales</td> <td>divs</td> <td>inLieu</td> <td>whTax</td> '
+              '<td>brkrInt.</td> <td>commiss.</td> <td>transTax</td> <td>fxGainLoss</td></tr> </thead> <tbody>\n')
             
-            idx = 0
-            for cashReport in root.iter('CashReportCurrency'):
-                if cashReport.get('currency') == 'SEK': continue
-                idx += 1
+            cash_reports = [r for r in elements['CashReportCurrency'] if r.get('currency') != 'SEK']
+            for idx, cashReport in enumerate(cash_reports, 1):
                 c = cashReport.get
-                is_base = c('currency') == 'BASE_SUMMARY'
-                cur_display = '<b>BASE</b>' if is_base else c('currency')
-                cur_telegram = 'BASE' if is_base else c('currency')
+                currency = c('currency')
+                is_base = currency == 'BASE_SUMMARY'
+                cur_display = '<b>BASE</b>' if is_base else currency
+                cur_telegram = 'BASE' if is_base else currency
+                ending_cash = fmt_num(c('endingCash'))
                 
-                print(f'<tr class="{"even" if idx % 2 else "odd"}">')
-                print(f'<td class="c">{cur_display}</td>')
-                print(f'<td class="r">{fmt_num(c("startingCash"))}</td>')
-                print(f'<td class="r">{fmt_num(c("endingCash"))}</td>')
-                print(f'<td class="r">{fmt_num(c("endingSettledCash"))}</td>')
-                print(f'<td class="r">{fmt_num(c("deposits"))}</td>')
-                print(f'<td class="r">{fmt_num(c("withdrawals"))}</td>')
-                print(f'<td class="r">{fmt_num(c("netTradesPurchases"))}</td>')
-                print(f'<td class="r">{fmt_num(c("netTradesSales"))}</td>')
-                print(f'<td class="r">{fmt_num(c("dividends"))}</td>')
-                print(f'<td class="r">{fmt_num(c("paymentInLieu"))}</td>')
-                print(f'<td class="r">{fmt_num(c("withholdingTax"))}</td>')
-                print(f'<td class="r">{fmt_num(c("brokerInterest"))}</td>')
-                print(f'<td class="r">{fmt_num(c("commissions"))}</td>')
-                print(f'<td class="r">{fmt_num(c("transactionTax"))}</td>')
-                print(f'<td class="r">{fmt_num(c("fxTranslationGainLoss"))}</td>')
-                print('</tr>')
+                w(f'{TR_EVEN if idx & 1 else TR_ODD}'
+                  f'<td class="c">{cur_display}</td>\n'
+                  f'<td class="r">{fmt_num(c("startingCash"))}</td>\n'
+                  f'<td class="r">{ending_cash}</td>\n'
+                  f'<td class="r">{fmt_num(c("endingSettledCash"))}</td>\n'
+                  f'<td class="r">{fmt_num(c("deposits"))}</td>\n'
+                  f'<td class="r">{fmt_num(c("withdrawals"))}</td>\n'
+                  f'<td class="r">{fmt_num(c("netTradesPurchases"))}</td>\n'
+                  f'<td class="r">{fmt_num(c("netTradesSales"))}</td>\n'
+                  f'<td class="r">{fmt_num(c("dividends"))}</td>\n'
+                  f'<td class="r">{fmt_num(c("paymentInLieu"))}</td>\n'
+                  f'<td class="r">{fmt_num(c("withholdingTax"))}</td>\n'
+                  f'<td class="r">{fmt_num(c("brokerInterest"))}</td>\n'
+                  f'<td class="r">{fmt_num(c("commissions"))}</td>\n'
+                  f'<td class="r">{fmt_num(c("transactionTax"))}</td>\n'
+                  f'<td class="r">{fmt_num(c("fxTranslationGainLoss"))}</td>\n'
+                  '</tr>\n')
                 # Use fmt_num for Telegram message to avoid raw long decimals
-                summary_msg += f"{cur_telegram.rjust(4, ' ')}: {fmt_num(c('endingCash'))}\n"
-            print('</tbody></table>')
+                summary_msg += f"{cur_telegram.rjust(4, ' ')}: {ending_cash}\n"
+            w('</tbody></table>\n')
             telegram_msgs.append(summary_msg)
 
             # CashTransactions
-            print('<h2>Cash Transactions</h2>')
-            print('<table> <thead> <tr><td>tckr</td> <td>date</td> <td>cur</td> <td>fxRate</td> <td>amount</td> <td>type</td> <td>description</td> <td>exchg</td></tr> </thead> <tbody>')
-            cash_txs = list(root.iter('CashTransaction'))
+            w('<h2>Cash Transactions</h2>\n')
+            w('<table> <thead> <tr><td>tckr</td> <td>date</td> <td>cur</td> <td>fxRate</td> <td>amount</td> <td>type</td> <td>description</td> <td>exchg</td></tr> </thead> <tbody>\n')
+            cash_txs = elements['CashTransaction']
             sortchildrenby(cash_txs, 'dateTime', 'symbol')
             for i, attrs in enumerate(cash_txs):
                 a = attrs.get
-                if a('type') == 'Dividends':
+                symbol = a('symbol')
+                currency = a('currency')
+                amount = a('amount')
+                description = a('description')
+                tx_type = a('type')
+                if tx_type == 'Dividends':
                     has_dividends = True
                     if not dividend_msg: dividend_msg = "Dividends\n" + "-" * 12 + "\n"
-                    dividend_msg += f"{a('symbol')}: {a('currency')} {fmt_num(a('amount'), 3)}\n{a('description')}\n"
+                    # Telegram messages are sent with HTML parse mode
+                    dividend_msg += f"{symbol}: {currency} {fmt_num(amount, 3)}\n{h(description)}\n"
                 
-                cls = 'red' if float(a('amount') or 0) < 0 else 'green'
-                print(f'<tr class="{"even" if i % 2 else "odd"}">')
-                print(f'<td class="r">{a("symbol")}</td><td class="c">{a("dateTime").split(";",1)[0]}</td><td class="c">{a("currency")}</td>')
-                print(f'<td>{fmt_num(a("fxRateToBase"), 7)}</td>')
-                print(f'<td class="r {cls}">{fmt_num(a("amount"), 4)}</td><td class="c">{a("type")}</td>')
-                print(f'<td>{a("description").replace(a("symbol"),"").strip()}</td><td class="r">{a("listingExchange")}</td>')
-                print('</tr>')
-            print('</tbody></table>')
+                cls = 'red' if float(amount or 0) < 0 else 'green'
+                w(f'{TR_EVEN if i & 1 else TR_ODD}'
+                  f'<td class="r">{symbol}</td><td class="c">{a("dateTime").split(";",1)[0]}</td><td class="c">{currency}</td>\n'
+                  f'<td>{fmt_num(a("fxRateToBase"), 7)}</td>\n'
+                  f'<td class="r {cls}">{fmt_num(amount, 4)}</td><td class="c">{tx_type}</td>\n'
+                  f'<td>{h(description.replace(symbol,"").strip())}</td><td class="r">{a("listingExchange")}</td>\n'
+                  '</tr>\n')
+            w('</tbody></table>\n')
             if has_dividends: telegram_msgs.append(dividend_msg)
 
             # TransactionTaxes
-            print('<h2>Transaction Taxes</h2>')
-            print('<table> <thead> <tr><td>tckr</td> <td>date</td> <td>cur</td> <td>fxRate</td> <td>tckr desc.</td> <td>taxAmt</td> <td>description</td> <td>exchg</td></tr> </thead> <tbody>')
-            taxes = list(root.iter('TransactionTax'))
+            w('<h2>Transaction Taxes</h2>\n')
+            w('<table> <thead> <tr><td>tckr</td> <td>date</td> <td>cur</td> <td>fxRate</td> <td>tckr desc.</td> <td>taxAmt</td> <td>description</td> <td>exchg</td></tr> </thead> <tbody>\n')
+            taxes = elements['TransactionTax']
             sortchildrenby(taxes, 'date')
             for i, a in enumerate(taxes):
-                print(f'<tr class="{"even" if i % 2 else "odd"}">')
-                print(f'<td>{a.get("symbol")}</td><td>{a.get("date")}</td><td>{a.get("currency")}</td><td>{fmt_num(a.get("fxRateToBase"), 7)}</td>')
-                print(f'<td>{a.get("description")}</td><td>{fmt_num(a.get("taxAmount"), 5)}</td><td>{a.get("taxDescription")}</td>')
-                print(f'<td class="r">{a.get("listingExchange")}</td></tr>')
-            print('</tbody></table>')
+                at = a.get
+                w(f'{TR_EVEN if i & 1 else TR_ODD}'
+                  f'<td>{at("symbol")}</td><td>{at("date")}</td><td>{at("currency")}</td><td>{fmt_num(at("fxRateToBase"), 7)}</td>\n'
+                  f'<td>{h(at("description"))}</td><td>{fmt_num(at("taxAmount"), 5)}</td><td>{h(at("taxDescription"))}</td>\n'
+                  f'<td class="r">{at("listingExchange")}</td></tr>\n')
+            w('</tbody></table>\n')
 
             # ChangeInDividendAccruals
-            print('<h2>Change in Dividend Accruals</h2>')
-            print('<table> <thead> <tr><td>tckr</td> <td>exdate</td> <td>paydate</td> <td>cur</td> <td>qty</td> <td>gRate</td> <td>gAmt</td> <td>tax</td> <td>taxPct</td> <td>nAmt</td> <td>description</td> <td>exchg</td></tr> </thead> <tbody>')
-            accruals = list(root.iter('ChangeInDividendAccrual'))
+            w('<h2>Change in Dividend Accruals</h2>\n')
+            w('<table> <thead> <tr><td>tckr</td> <td>exdate</td> <td>paydate</td> <td>cur</td> <td>qty</td> <td>gRate</td> <td>gAmt</td> <td>tax</td> <td>taxPct</td> <td>nAmt</td> <td>description</td> <td>exchg</td></tr> </thead> <tbody>\n')
+            accruals = elements['ChangeInDividendAccrual']
             sortchildrenby(accruals, 'payDate', 'symbol')
             for a in accruals:
                 at = a.get
                 net = float(at('netAmount') or 0)
-                cls = 'red' if net < 0 else 'green'
+                tr = TR_RED if net < 0 else TR_GREEN
                 tax = float(at('tax') or 0)
                 qty = float(at('quantity') or 1)
                 grate = float(at('grossRate') or 1)
                 taxpct = (tax * 100) / (qty * grate) if (qty * grate) != 0 else 0
                 
-                print(f'<tr class="{cls}">')
-                print(f'<td class="r">{at("symbol").rjust(4)}</td><td>{at("exDate")}</td><td>{at("payDate")}</td><td>{at("currency")}</td>')
-                print(f'<td class="r">{fmt_num(at("quantity"), 0).rjust(3)}</td><td class="r">{fmt_num(at("grossRate"), 3)}</td><td class="r">{fmt_num(at("grossAmount"), 3)}</td>')
-                print(f'<td class="r">{fmt_num(at("tax"), 3)}</td><td class="r">{fmt_num(taxpct, 2)}%</td><td class="r">{fmt_num(at("netAmount"), 3)}</td>')
-                print(f'<td>{at("description")}</td><td class="r">{at("listingExchange")}</td></tr>')
-            print('</tbody></table>')
+                w(f'{tr}'
+                  f'<td class="r">{at("symbol").rjust(4)}</td><td>{at("exDate")}</td><td>{at("payDate")}</td><td>{at("currency")}</td>\n'
+                  f'<td class="r">{fmt_num(at("quantity"), 0).rjust(3)}</td><td class="r">{fmt_num(at("grossRate"), 3)}</td><td class="r">{fmt_num(at("grossAmount"), 3)}</td>\n'
+                  f'<td class="r">{fmt_num(at("tax"), 3)}</td><td class="r">{fmt_num(taxpct, 2)}%</td><td class="r">{fmt_num(at("netAmount"), 3)}</td>\n'
+                  f'<td>{h(at("description"))}</td><td class="r">{at("listingExchange")}</td></tr>\n')
+            w('</tbody></table>\n')
 
             # OpenDividendAccruals
-            print('<h2>Open Dividend Accruals</h2>')
-            print('<table> <thead> <tr><td>tckr</td> <td>exdate</td> <td>paydate</td> <td>cur</td> <td>qty</td> <td>gRate</td> <td>gAmt</td> <td>tax</td> <td>taxPct</td> <td>nAmt</td> <td>description</td> <td>exchg</td></tr> </thead> <tbody>')
-            open_accruals = list(root.iter('OpenDividendAccrual'))
+            w('<h2>Open Dividend Accruals</h2>\n')
+            w('<table> <thead> <tr><td>tckr</td> <td>exdate</td> <td>paydate</td> <td>cur</td> <td>qty</td> <td>gRate</td> <td>gAmt</td> <td>tax</td> <td>taxPct</td> <td>nAmt</td> <td>description</td> <td>exchg</td></tr> </thead> <tbody>\n')
+            open_accruals = elements['OpenDividendAccrual']
             sortchildrenby(open_accruals, 'payDate', 'symbol')
             for i, a in enumerate(open_accruals):
                 at = a.get
@@ -209,70 +259,70 @@ class FlexReporter:
                 qty = float(at('quantity') or 1)
                 grate = float(at('grossRate') or 1)
                 taxpct = (tax * 100) / (qty * grate) if (qty * grate) != 0 else 0
-                print(f'<tr class="{"even" if i % 2 else "odd"}">')
-                print(f'<td class="r">{at("symbol").rjust(4)}</td><td>{at("exDate")}</td><td>{at("payDate")}</td><td>{at("currency")}</td>')
-                print(f'<td class="r">{fmt_num(at("quantity"), 0).rjust(3)}</td><td class="r">{fmt_num(at("grossRate"), 3)}</td><td class="r">{fmt_num(at("grossAmount"), 3)}</td>')
-                print(f'<td class="r">{fmt_num(at("tax"), 3)}</td><td class="r">{fmt_num(taxpct, 2)}%</td><td class="r">{fmt_num(at("netAmount"), 3)}</td>')
-                print(f'<td>{at("description")}</td><td class="r">{at("listingExchange")}</td></tr>')
-            print('</tbody></table>')
+                w(f'{TR_EVEN if i & 1 else TR_ODD}'
+                  f'<td class="r">{at("symbol").rjust(4)}</td><td>{at("exDate")}</td><td>{at("payDate")}</td><td>{at("currency")}</td>\n'
+                  f'<td class="r">{fmt_num(at("quantity"), 0).rjust(3)}</td><td class="r">{fmt_num(at("grossRate"), 3)}</td><td class="r">{fmt_num(at("grossAmount"), 3)}</td>\n'
+                  f'<td class="r">{fmt_num(at("tax"), 3)}</td><td class="r">{fmt_num(taxpct, 2)}%</td><td class="r">{fmt_num(at("netAmount"), 3)}</td>\n'
+                  f'<td>{h(at("description"))}</td><td class="r">{at("listingExchange")}</td></tr>\n')
+            w('</tbody></table>\n')
 
             # TierInterestDetails
-            print('<h2>Interest Details</h2>')
-            print('<table> <thead> <tr><td>date</td> <td>cur</td> <td>total</td> <td>fxRate</td> <td>rate</td> <td>amt</td> <td>description</td></tr> </thead> <tbody>')
-            interest = list(root.iter('TierInterestDetail'))
+            w('<h2>Interest Details</h2>\n')
+            w('<table> <thead> <tr><td>date</td> <td>cur</td> <td>total</td> <td>fxRate</td> <td>rate</td> <td>amt</td> <td>description</td></tr> </thead> <tbody>\n')
+            interest = elements['TierInterestDetail']
             sortchildrenby(interest, 'valueDate', 'currency')
             for i, a in enumerate(interest):
                 at = a.get
-                print(f'<tr class="{"even" if i % 2 else "odd"}">')
-                print(f'<td>{at("valueDate")}</td><td>{at("currency")}</td><td class="r">{fmt_num(at("totalPrincipal"))}</td>')
-                print(f'<td>{fmt_num(at("fxRateToBase"), 7)}</td><td class="r">{fmt_num(at("rate"))}%</td><td>{fmt_num(at("totalInterest"))}</td><td>{at("interestType")}</td></tr>')
-            print('</tbody></table>')
+                w(f'{TR_EVEN if i & 1 else TR_ODD}'
+                  f'<td>{at("valueDate")}</td><td>{at("currency")}</td><td class="r">{fmt_num(at("totalPrincipal"))}</td>\n'
+                  f'<td>{fmt_num(at("fxRateToBase"), 7)}</td><td class="r">{fmt_num(at("rate"))}%</td><td>{fmt_num(at("totalInterest"))}</td><td>{at("interestType")}</td></tr>\n')
+            w('</tbody></table>\n')
 
             # Trades
-            print('<h2>Trades</h2>')
-            print('<table> <thead> <tr><td>tckr</td> <td>date</td> <td>buySell</td> <td>cur</td> <td>fxRate</td> <td>qty</td> <td>price</td> <td>comm</td> <td>comCur</td> <td>netCash</td> <td>desc</td> <td>underl</td> <td>mult</td> <td>strike</td> <td>expiry</td> <td>p/c</td> <td>exchg</td> <td>listExch</td> <td>undExh</td></tr> </thead> <tbody>')
-            trades = list(root.iter('Trade'))
+            w('<h2>Trades</h2>\n')
+            w('<table> <thead> <tr><td>tckr</td> <td>date</td> <td>buySell</td> <td>cur</td> <td>fxRate</td> <td>qty</td> <td>price</td> <td>comm</td> <td>comCur</td> <td>netCash</td> <td>desc</td> <td>underl</td> <td>mult</td> <td>strike</td> <td>expiry</td> <td>p/c</td> <td>exchg</td> <td>listExch</td> <td>undExh</td></tr> </thead> <tbody>\n')
+            trades = elements['Trade']
             sortchildrenby(trades, 'tradeDate', 'symbol')
             for a in trades:
                 at = a.get
-                cls = 'green' if at('buySell') == 'SELL' else 'red'
-                net = float(at('netCash') or 0)
+                buy_sell = at('buySell')
+                net_cash = at('netCash')
+                strike = at('strike')
+                tr = TR_GREEN if buy_sell == 'SELL' else TR_RED
+                net = float(net_cash or 0)
                 comm = float(at('ibCommission') or 0)
                 qty = float(at('quantity') or 1)
                 u_price = -1 * (net - comm) / qty if qty != 0 else 0
                 
-                print(f'<tr class="{cls}">')
-                print(f'<td class="r">{at("symbol")}</td><td>{at("tradeDate")}</td><td class="c">{at("buySell")}</td><td>{at("currency")}</td>')
-                print(f'<td>{fmt_num(at("fxRateToBase"), 7)}</td><td class="r">{fmt_num(at("quantity"))}</td><td class="r">{fmt_num(u_price, 4)}</td>')
-                print(f'<td class="r">{fmt_num(-1*comm, 8)}</td><td class="c">{at("ibCommissionCurrency")}</td><td class="r">{fmt_num(at("netCash"), 8)}</td>')
-                print(f'<td>{at("description")}</td><td class="r">{at("underlyingSymbol")}</td><td class="r">{fmt_num(at("multiplier"))}</td>')
-                print(f'<td class="r">{fmt_num(at("strike"), 2) if at("strike") else ""}</td><td>{at("expiry")}</td><td class="c">{at("putCall")}</td>')
-                print(f'<td class="c">{at("exchange")}</td><td class="c">{at("listingExchange")}</td><td class="c">{at("underlyingListingExchange")}</td></tr>')
-            print('</tbody></table>')
+                w(f'{tr}'
+                  f'<td class="r">{at("symbol")}</td><td>{at("tradeDate")}</td><td class="c">{buy_sell}</td><td>{at("currency")}</td>\n'
+                  f'<td>{fmt_num(at("fxRateToBase"), 7)}</td><td class="r">{fmt_num(at("quantity"))}</td><td class="r">{fmt_num(u_price, 4)}</td>\n'
+                  f'<td class="r">{fmt_num(-1*comm, 8)}</td><td class="c">{at("ibCommissionCurrency")}</td><td class="r">{fmt_num(net_cash, 8)}</td>\n'
+                  f'<td>{h(at("description"))}</td><td class="r">{at("underlyingSymbol")}</td><td class="r">{fmt_num(at("multiplier"))}</td>\n'
+                  f'<td class="r">{fmt_num(strike, 2) if strike else ""}</td><td>{at("expiry")}</td><td class="c">{at("putCall")}</td>\n'
+                  f'<td class="c">{at("exchange")}</td><td class="c">{at("listingExchange")}</td><td class="c">{at("underlyingListingExchange")}</td></tr>\n')
+            w('</tbody></table>\n')
 
             # ConversionRates
-            print('<h2>Conversion Rates</h2>')
-            print('<table> <thead> <tr><td>date</td> <td>from</td> <td>rate</td> <td>to</td> <td>rate</td></tr> </thead> <tbody>')
-            rates = list(root.iter('ConversionRate'))
+            w('<h2>Conversion Rates</h2>\n')
+            w('<table> <thead> <tr><td>date</td> <td>from</td> <td>rate</td> <td>to</td> <td>rate</td></tr> </thead> <tbody>\n')
+            # Only USD and GBP rates are shown; drop the rest before sorting
+            rates = [r for r in elements['ConversionRate'] if r.get('fromCurrency') in ('USD', 'GBP')]
             sortchildrenby(rates, 'reportDate', 'fromCurrency')
-            idx = 0
-            for a in rates:
+            for idx, a in enumerate(rates, 1):
                 at = a.get
-                if at('fromCurrency') not in ['USD', 'GBP']: continue
-                idx += 1
+                from_currency = at('fromCurrency')
                 rate = float(at('rate') or 1)
                 inv = 1 / rate if rate != 0 else 0
-                print(f'<tr class="{"even" if idx % 2 else "odd"}">')
-                print(f'<td>{at("reportDate")}</td><td>{at("fromCurrency")}EUR</td><td>{fmt_num(rate, 7)}</td>')
-                print(f'<td>EUR{at("fromCurrency")}</td><td>{fmt_num(inv, 10)}</td></tr>')
-            print('</tbody></table>')
+                w(f'{TR_EVEN if idx & 1 else TR_ODD}'
+                  f'<td>{at("reportDate")}</td><td>{from_currency}EUR</td><td>{fmt_num(rate, 7)}</td>\n'
+                  f'<td>EUR{from_currency}</td><td>{fmt_num(inv, 10)}</td></tr>\n')
+            w('</tbody></table>\n')
 
         except Exception as e:
-            sys.stdout = old_stdout
             return f"Error generating report: {e}", None, None, [], None
         
-        sys.stdout = old_stdout
-        html_content = result.getvalue()
+        html_content = "".join(out)
         return html_content, dateRangeHTML, dateRangeSubject, telegram_msgs, archive_status
 
     @staticmethod
@@ -302,11 +352,11 @@ class FlexReporter:
         msg.attach(MIMEText(full_html, 'html'))
 
         try:
-            server = smtplib.SMTP(settings.EMAIL_SMTP_SERVER, settings.EMAIL_SMTP_PORT)
-            server.starttls()
-            server.login(settings.EMAIL_SMTP_USER, settings.EMAIL_SMTP_PASSWORD)
-            server.sendmail(msg['From'], msg['To'], msg.as_string())
-            server.quit()
+            # The context manager QUITs (or closes) the connection even when a step fails
+            with smtplib.SMTP(settings.EMAIL_SMTP_SERVER, settings.EMAIL_SMTP_PORT, timeout=SMTP_TIMEOUT) as server:
+                server.starttls()
+                server.login(settings.EMAIL_SMTP_USER, settings.EMAIL_SMTP_PASSWORD)
+                server.sendmail(msg['From'], msg['To'], msg.as_string())
             return "Email sent successfully"
         except Exception as e:
             return f"Failed to send email: {e}"
\ No newline at end of file
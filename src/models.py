@@ -1,7 +1,7 @@
 from datetime import datetime
 from typing import List, Optional
 from pydantic import BaseModel
-from sqlalchemy import Column, Float, String, DateTime, Integer, Numeric
+from sqlalchemy import Column, Float, String, DateTime, Integer, Numeric, Index
 from sqlalchemy.orm import declarative_base
 
 # --- Pydantic Models (API Responses) ---
@@ -129,4 +129,5 @@ class CashBalance(Base):
     excessLiq = Column(Numeric(18, 4))
     maintMargin = Column(Numeric(18, 4))
 
-
+    # Backs the all-time-high lookup (ORDER BY nav DESC LIMIT 1)
+    __table_args__ = (Index('ix_balances_nav', nav.desc()),)
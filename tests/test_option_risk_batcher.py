@@ -0,0 +1,85 @@
+import asyncio
+import os
+import unittest
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+os.environ.setdefault("API_KEY", "test")
+
+from src.api import OptionRiskBatcher, parse_option_symbol
+
+
+class FakeEvent:
+    def __init__(self):
+        self.handlers = []
+
+    def __iadd__(self, handler):
+        self.handlers.append(handler)
+        return self
+
+    def __isub__(self, handler):
+        self.handlers.remove(handler)
+        return self
+
+    def emit(self, tickers):
+        for handler in list(self.handlers):
+            handler(tickers)
+
+
+def greeks(delta):
+    return SimpleNamespace(delta=delta, gamma=0.01, vega=0.1, theta=-0.05, impliedVol=0.3, undPrice=50.0)
+
+
+class FakeIB:
+    """IB stand-in whose ticker still holds data from an earlier subscription."""
+
+    def __init__(self):
+        self.pendingTickersEvent = FakeEvent()
+        self.tickers = {}
+
+    async def qualifyContractsAsync(self, contract):
+        contract.conId = 1
+        return [contract]
+
+    def ticker(self, contract):
+        return self.tickers.get(contract.conId)
+
+    def reqMktData(self, contract, *args):
+        t = self.tickers.setdefault(contract.conId, SimpleNamespace(
+            contract=contract, time=datetime.now(timezone.utc) - timedelta(minutes=5),
+            modelGreeks=greeks(0.1), bidGreeks=None, askGreeks=None, lastGreeks=None,
+            last=float('nan'), volume=0, openInterest=0,
+        ))
+
+        def tick():
+            t.modelGreeks = greeks(0.5)
+            t.time = datetime.now(timezone.utc)
+            self.pendingTickersEvent.emit([t])
+
+        asyncio.get_running_loop().call_later(0.05, tick)
+
+    def cancelMktData(self, contract):
+        pass
+
+
+class OptionRiskBatcherTest(unittest.IsolatedAsyncioTestCase):
+    async def test_waits_for_fresh_data_on_cached_ticker(self):
+        client = FakeIB()
+        batcher = OptionRiskBatcher(client, timeout=1.0)
+        batcher.start()
+        try:
+            symbol = "ASTS260109P00065000"
+            first = await batcher.submit(symbol, parse_option_symbol(symbol))
+            # The ticker outlives the first subscription with its old data
+            client.tickers[1].modelGreeks = greeks(0.1)
+            client.tickers[1].time -= timedelta(minutes=5)
+            second = await batcher.submit(symbol, parse_option_symbol(symbol))
+        finally:
+            await batcher.stop()
+
+        self.assertEqual(first.delta, 0.5)
+        self.assertEqual(second.delta, 0.5)
+
+
+if __name__ == "__main__":
+    unittest.main()